@@ -6,9 +6,43 @@ from ..utils.transforms import vecToMatrix
 import logging
 
 
+# detector and board per board configuration, creating them dominates a call
+_aruco_cache = {}
+
+
+def _get_aruco_detector(config: dict):
+    key = (
+        config["aruco_type"],
+        tuple(config["num_markers"]),
+        config["marker_size"],
+        config["marker_seperation"],
+    )
+    if key not in _aruco_cache:
+        aruco_dict = aruco.getPredefinedDictionary(config["aruco_type"])
+        aruco_params = aruco.DetectorParameters()
+        detector = aruco.ArucoDetector(aruco_dict, aruco_params)
+        board = aruco.GridBoard(
+            config["num_markers"],
+            config["marker_size"],
+            config["marker_seperation"],
+            aruco_dict,
+        )
+        _aruco_cache[key] = (detector, board)
+    return _aruco_cache[key]
+
+
 def get_aruco_pose(
-    config: Union[list, dict], img: np.ndarray, intrinsics_matrix, distortion
+    config: Union[list, dict],
+    img: np.ndarray,
+    intrinsics_matrix,
+    distortion,
+    draw=True,
 ):
+    """Detect an ArUco grid board and estimate its pose in the camera frame.
+
+    Returns the annotated image, or None with ``draw=False``, and the 4x4 board
+    pose, None unless all markers are detected.
+    """
     if isinstance(config, dict):
         assert all(
             [
@@ -21,16 +55,8 @@ def get_aruco_pose(
                 ]
             ]
         )
-        aruco_type = config["aruco_type"]
         num_markers = config["num_markers"][0] * config["num_markers"][1]
-        marker_size = config["marker_size"]
-        marker_seperation = config["marker_seperation"]
-        aruco_dict = aruco.getPredefinedDictionary(aruco_type)
-        aruco_params = aruco.DetectorParameters()
-        detector = aruco.ArucoDetector(aruco_dict, aruco_params)
-        board = aruco.GridBoard(
-            config["num_markers"], marker_size, marker_seperation, aruco_dict
-        )
+        detector, board = _get_aruco_detector(config)
         try:
             corners, ids, rejected_markers = detector.detectMarkers(img)
             corners, ids, rejected_markers, _ = detector.refineDetectedMarkers(
@@ -42,11 +68,15 @@ def get_aruco_pose(
                 cameraMatrix=intrinsics_matrix,
                 distCoeffs=distortion,
             )
-            img_copy = img.copy()
-            img_markers = aruco.drawDetectedMarkers(img_copy, corners, ids)
+            img_markers = None
+            if draw:
+                img_copy = img.copy()
+                img_markers = aruco.drawDetectedMarkers(img_copy, corners, ids)
             if ids is not None and len(ids) == num_markers:
                 objp, imgp = board.matchImagePoints(corners, ids)
                 _, rvec, tvec = cv2.solvePnP(objp, imgp, intrinsics_matrix, distortion)
+                if not draw:
+                    return None, vecToMatrix(rvec.squeeze(), tvec.squeeze())
                 img_axes = cv2.drawFrameAxes(
                     img_markers,
                     intrinsics_matrix,
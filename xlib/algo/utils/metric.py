@@ -1,3 +1,4 @@
+import cv2
 import skimage.metrics
 import numpy as np
 import torch
@@ -11,6 +12,47 @@ def calc_ssim(img1: np.ndarray, img2: np.ndarray) -> float:
     return score
 
 
+def ssim_stats(img: np.ndarray, win_size=7) -> dict:
+    """Local mean and variance of ``img`` for repeated SSIM against it.
+
+    Matches ``calc_ssim``: uniform window and sample covariance like the
+    skimage defaults.
+    """
+    x = img.astype(np.float32)
+    NP = win_size * win_size
+    mu = cv2.boxFilter(x, -1, (win_size, win_size), borderType=cv2.BORDER_REFLECT)
+    xx = cv2.boxFilter(x * x, -1, (win_size, win_size), borderType=cv2.BORDER_REFLECT)
+    var = NP / (NP - 1) * (xx - mu * mu)
+    return {"img": x, "mu": mu, "var": var, "win_size": win_size}
+
+
+def calc_ssim_cached(target_stats: dict, img: np.ndarray, data_range=255.0) -> float:
+    """SSIM of ``img`` against an image summarized by ``ssim_stats``.
+
+    Only the terms of ``img`` and the cross term are computed per call. The
+    statistics are float32, so the score agrees with ``calc_ssim`` to float32
+    precision, differences up to a few 1e-7, not exactly.
+    """
+    x = target_stats["img"]
+    assert x.shape == img.shape, "Image shapes do not match"
+    win_size = target_stats["win_size"]
+    NP = win_size * win_size
+    y = img.astype(np.float32)
+    mu_y = cv2.boxFilter(y, -1, (win_size, win_size), borderType=cv2.BORDER_REFLECT)
+    yy = cv2.boxFilter(y * y, -1, (win_size, win_size), borderType=cv2.BORDER_REFLECT)
+    xy = cv2.boxFilter(x * y, -1, (win_size, win_size), borderType=cv2.BORDER_REFLECT)
+    mu_x = target_stats["mu"]
+    var_y = NP / (NP - 1) * (yy - mu_y * mu_y)
+    cov = NP / (NP - 1) * (xy - mu_x * mu_y)
+    C1 = (0.01 * data_range) ** 2
+    C2 = (0.03 * data_range) ** 2
+    S = ((2 * mu_x * mu_y + C1) * (2 * cov + C2)) / (
+        (mu_x * mu_x + mu_y * mu_y + C1) * (target_stats["var"] + var_y + C2)
+    )
+    pad = (win_size - 1) // 2
+    return float(S[pad:-pad, pad:-pad].mean(dtype=np.float64))
+
+
 def calc_psnr(
     img1: Union[np.ndarray, torch.Tensor],
     img2: Union[np.ndarray, torch.Tensor],
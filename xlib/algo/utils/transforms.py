@@ -37,6 +37,34 @@ def velTransform(vel, rot_matrix):
     return trans_matrix @ vel
 
 
+def se3Log(trans_matrix):
+    """Twist (v, w) whose exponential is the transformation matrix
+
+    Args:
+        trans_matrix (np.ndarray): 4x4 transformation matrix
+
+    Returns:
+        np.ndarray: 6D twist, translational part first like the velocities above
+    """
+    rot_vec = R.from_matrix(trans_matrix[:3, :3]).as_rotvec()
+    theta = np.linalg.norm(rot_vec)
+    skew = np.array(
+        [
+            [0.0, -rot_vec[2], rot_vec[1]],
+            [rot_vec[2], 0.0, -rot_vec[0]],
+            [-rot_vec[1], rot_vec[0], 0.0],
+        ]
+    )
+    if theta < 1e-6:
+        coeff = 1.0 / 12.0
+    else:
+        coeff = (1.0 - theta * np.sin(theta) / (2.0 * (1.0 - np.cos(theta)))) / (
+            theta * theta
+        )
+    V_inv = np.eye(3) - 0.5 * skew + coeff * skew @ skew
+    return np.concatenate((V_inv @ trans_matrix[:3, 3], rot_vec))
+
+
 def vecToMatrix(rvec, tvec):
     matrix = np.eye(4)
     rot_matrix = R.from_rotvec(rvec).as_matrix()
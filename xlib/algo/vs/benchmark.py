@@ -0,0 +1,55 @@
+import time
+import logging
+import numpy as np
+from .kp_matcher import RomaMatchAlgo
+
+ROMA_MODEL_TYPES = ["roma_indoor", "roma_outdoor", "tiny_roma_v1_outdoor"]
+
+
+def time_match(algo, img1, img2, repeats=10, warmup=2) -> dict:
+    """Time ``algo.match(img1, img2)`` and return statistics in milliseconds."""
+    for _ in range(warmup):
+        algo.match(img1, img2, ransac=False)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        algo.match(img1, img2, ransac=False)
+        times.append((time.perf_counter() - start) * 1000.0)
+    times = np.array(times)
+    return {
+        "mean_ms": float(times.mean()),
+        "median_ms": float(np.median(times)),
+        "min_ms": float(times.min()),
+        "max_ms": float(times.max()),
+    }
+
+
+def benchmark_roma(
+    img1: np.ndarray,
+    img2: np.ndarray,
+    model_types=ROMA_MODEL_TYPES,
+    device="cpu",
+    repeats=10,
+    warmup=2,
+    **kwargs,
+) -> dict:
+    """Report ms per match of every RoMa model type on one image pair.
+
+    ``img1`` is the target and stays fixed like in servoing, so target caching
+    is measured in steady state. ``kwargs`` are forwarded to ``RomaMatchAlgo``,
+    e.g. coarse_res, upsample_res, num_threads or cache_target.
+    """
+    results = {}
+    for model_type in model_types:
+        algo = RomaMatchAlgo(model_type, device, **kwargs)
+        results[model_type] = time_match(algo, img1, img2, repeats, warmup)
+        logging.info(
+            "{}: mean {:.1f} ms, median {:.1f} ms, min {:.1f} ms".format(
+                model_type,
+                results[model_type]["mean_ms"],
+                results[model_type]["median_ms"],
+                results[model_type]["min_ms"],
+            )
+        )
+        del algo
+    return results
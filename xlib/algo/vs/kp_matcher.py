@@ -1,15 +1,166 @@
 import cv2
-import cv2
+import hashlib
+import logging
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
+import torch
 from ...device.sensor.camera import Camera
 from ..RoMa.romatch import *
+from .matcher_backend import create_matcher_backend
+from .match_vis import MatchRenderer, visualize_matches
+from .match_select import select_matches
+from .pyramid import downscale, refine_matches, to_gray
+
+
+def image_key(img: np.ndarray):
+    """Content hash of an image, used to recognize a cached target image."""
+    digest = hashlib.blake2b(np.ascontiguousarray(img).data, digest_size=16)
+    return img.shape, img.dtype.str, digest.hexdigest()
+
+
+def _load_image(src):
+    if isinstance(src, str):
+        img = cv2.imread(src)
+        assert img is not None, f"Failed to read image {src}"
+        return img
+    return src
+
+
+def _group_blocks(pairs, block_size):
+    """Split ``pairs`` into blocks, each ordered so that pairs sharing the first image are adjacent.
+
+    Yields (positions, pairs) with the original position of every pair in its block.
+    """
+    block = []
+    for pair in pairs:
+        block.append(pair)
+        if len(block) == block_size:
+            yield _sort_block(block)
+            block = []
+    if block:
+        yield _sort_block(block)
+
+
+def _sort_block(block):
+    groups = {}
+    keys = [
+        groups.setdefault(src if isinstance(src, str) else id(src), len(groups))
+        for src, _ in block
+    ]
+    positions = sorted(range(len(block)), key=lambda i: keys[i])
+    return positions, [block[i] for i in positions]
+
+
+_worker = None
+
+
+def _init_match_worker(config, mask, ransac, camera):
+    global _worker
+    # one process per core, keep OpenCV from spawning threads in every worker
+    cv2.setNumThreads(1)
+    _worker = (KpMatchAlgo(**config), mask, ransac, camera)
+
+
+def _match_chunk(chunk):
+    algo, mask, ransac, camera = _worker
+    results = []
+    for src1, src2 in chunk:
+        tar_kp, cur_kp, _ = algo.match(
+            _load_image(src1), _load_image(src2), mask, ransac, camera
+        )
+        results.append((tar_kp, cur_kp))
+    return results
 
 
 class RomaMatchAlgo:
-    def __init__(self, model_type="roma_indoor", device="cuda") -> None:
+    def __init__(
+        self,
+        model_type="roma_indoor",
+        device="cuda",
+        visualize=False,
+        render_rate=10.0,
+        max_matches=200,
+        select_grid=(8, 8),
+        seed=0,
+        pyramid_scale=None,
+        coarse_res=None,
+        upsample_res=None,
+        num_threads=None,
+        cache_target=True,
+        ransac_max_iters=10000,
+    ) -> None:
+        """
+        Args:
+            device (str): "cuda" or "cpu".
+            coarse_res (int or tuple, optional): inference resolution of the coarse
+                matcher, a multiple of 14. Lower values trade accuracy for speed on CPU.
+            upsample_res (int or tuple, optional): resolution of the refinement pass.
+            num_threads (int, optional): torch intra-op threads, e.g. the number of
+                physical cores of a CPU node.
+            cache_target (bool): reuse the encoder features of the target image
+                while it does not change, halving the encoder cost per match.
+            ransac_max_iters (int): iterations of the fundamental matrix RANSAC, can
+                be lowered when the controller solves robustly, e.g. ``IBVS(robust=...)``.
+            max_matches (int, optional): match budget, the most certain matches are
+                kept spread over a ``select_grid`` of image cells, None keeps all.
+            seed (int): tie break seed of the selection.
+            pyramid_scale (float, optional): match on images downscaled by this
+                factor and refine the matches at full resolution, see ``refine_matches``.
+        """
         self.model_type = model_type
-        self.model = eval(model_type)(device=device)
+        self.pyramid_scale = pyramid_scale
+        self.ransac_max_iters = ransac_max_iters
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+        model_kwargs = {}
+        if coarse_res is not None:
+            model_kwargs["coarse_res"] = coarse_res
+        if upsample_res is not None:
+            model_kwargs["upsample_res"] = upsample_res
+        if model_kwargs and model_type == "tiny_roma_v1_outdoor":
+            logging.warning("Tiny RoMa has a fixed resolution, ignoring resolution settings")
+            model_kwargs = {}
+        self.model = eval(model_type)(device=device, **model_kwargs)
+        self.model.eval()
         self.device = device
+        self._target_key = None
+        self._target_features = {}
+        if cache_target and hasattr(self.model, "extract_backbone_features"):
+            self._cache_backbone_features()
+        self.max_matches = max_matches
+        self.select_grid = select_grid
+        self.seed = seed
+        self.visualize = visualize
+        self.renderer = MatchRenderer(render_rate).start() if visualize == "async" else None
+
+    def _cache_backbone_features(self):
+        """Wrap the model's feature extraction to reuse the target (im_A) features.
+
+        The encoder processes every image of the batch independently, so the
+        target features can be computed once per target and resolution and
+        concatenated with the features of the current image.
+        """
+        extract = self.model.extract_backbone_features
+        encoder = self.model.encoder
+
+        def extract_backbone_features(batch, batched=True, upsample=False):
+            x_q, x_s = batch["im_A"], batch["im_B"]
+            if self._target_key is None or x_q.shape[0] != 1:
+                return extract(batch, batched=batched, upsample=upsample)
+            key = (upsample, tuple(x_q.shape))
+            if key not in self._target_features:
+                self._target_features[key] = encoder(x_q, upsample=upsample)
+            feature_q = self._target_features[key]
+            feature_s = encoder(x_s, upsample=upsample)
+            if not batched:
+                return feature_q, feature_s
+            return {
+                scale: torch.cat((feature_q[scale], feature_s[scale]), dim=0)
+                for scale in feature_s
+            }
+
+        self.model.extract_backbone_features = extract_backbone_features
 
     def match(
         self, img1: np.ndarray, img2: np.ndarray, mask=None, ransac=True, camera=None
@@ -18,26 +169,46 @@ class RomaMatchAlgo:
         assert img2 is not None, "Color Image 2 not provided"
         h1, w1 = img1.shape[:2]
         h2, w2 = img2.shape[:2]
-        if self.model_type == "tiny_roma_v1_outdoor":
-            warp, certainty = self.model.match(img1, img2)
-        else:
-            warp, certainty = self.model.match(img1, img2, device=self.device)
-        matches, certainty = self.model.sample(warp, certainty)
+        target_key = image_key(img1)
+        if target_key != self._target_key:
+            self._target_key = target_key
+            self._target_features = {}
+        small1 = downscale(img1, self.pyramid_scale)
+        small2 = downscale(img2, self.pyramid_scale)
+        with torch.inference_mode():
+            if self.model_type == "tiny_roma_v1_outdoor":
+                warp, certainty = self.model.match(small1, small2)
+            else:
+                warp, certainty = self.model.match(small1, small2, device=self.device)
+            matches, certainty = self.model.sample(warp, certainty)
         kptsA, kptsB = self.model.to_pixel_coordinates(matches, h1, w1, h2, w2)
+        kptsA_array = kptsA.cpu().numpy()
+        kptsB_array = kptsB.cpu().numpy()
+        certainty = certainty.cpu().numpy()
+        if self.pyramid_scale is not None:
+            keep, kptsB_array = refine_matches(
+                to_gray(img1),
+                to_gray(img2),
+                kptsA_array,
+                kptsB_array,
+                self.pyramid_scale,
+            )
+            kptsA_array = kptsA_array[keep]
+            kptsB_array = kptsB_array[keep]
+            certainty = certainty[keep]
         F, ransac_mask = cv2.findFundamentalMat(
-            kptsA.cpu().numpy(),
-            kptsB.cpu().numpy(),
+            kptsA_array,
+            kptsB_array,
             ransacReprojThreshold=0.2,
             method=cv2.RANSAC,
             confidence=0.999999,
-            maxIters=10000,
+            maxIters=self.ransac_max_iters,
         )
-        kptsA_array = kptsA.cpu().numpy()
-        kptsB_array = kptsB.cpu().numpy()
         if ransac:
             ransac_mask = ransac_mask.ravel().astype(bool)
             kptsA_array = kptsA_array[ransac_mask].reshape(-1, 2)
             kptsB_array = kptsB_array[ransac_mask].reshape(-1, 2)
+            certainty = certainty[ransac_mask]
 
         if mask is not None:
             kptsA_array_int = np.clip(
@@ -55,40 +226,99 @@ class RomaMatchAlgo:
 
             kptsA_array = kptsA_array[mask]
             kptsB_array = kptsB_array[mask]
-        if kptsA_array.shape[0] > 200:
-            samples = np.random.choice(kptsA_array.shape[0], 200, replace=False)
-            kptsA_array = kptsA_array[samples]
-            kptsB_array = kptsB_array[samples]
-        match_img = self._draw_matches(img1, kptsA_array, img2, kptsB_array)
-        return kptsA_array, kptsB_array, match_img
-
-    def _draw_matches(self, img1, keypoints1, img2, keypoints2):
-        img1_height, img1_width = img1.shape[:2]
-        img2_height, img2_width = img2.shape[:2]
-
-        combined_image = np.zeros(
-            (max(img1_height, img2_height), img1_width + img2_width, 3), dtype=np.uint8
+            certainty = certainty[mask]
+        samples = select_matches(
+            kptsB_array,
+            img2.shape,
+            self.max_matches,
+            certainty,
+            self.select_grid,
+            seed=self.seed,
         )
+        kptsA_array = kptsA_array[samples]
+        kptsB_array = kptsB_array[samples]
+        match_img = visualize_matches(
+            self.visualize, self.renderer, img1, kptsA_array, img2, kptsB_array
+        )
+        return kptsA_array, kptsB_array, match_img
 
-        combined_image[:img1_height, :img1_width] = img1
-
-        combined_image[:img2_height, img1_width : img1_width + img2_width] = img2
-        shifted_keypoints2 = [(x + img1_width, y) for (x, y) in keypoints2]
-
-        for (x1, y1), (x2, y2) in zip(keypoints1, shifted_keypoints2):
-            color = tuple(np.random.randint(0, 255, 3).tolist())
-            cv2.circle(combined_image, (int(x1), int(y1)), 3, color, 1)
-            cv2.circle(combined_image, (int(x2), int(y2)), 3, color, 1)
-            cv2.line(combined_image, (int(x1), int(y1)), (int(x2), int(y2)), color, 1)
+    def match_many(self, pairs, mask=None, ransac=True, camera=None):
+        """Match many (img1, img2) pairs, yielding (kptsA, kptsB) in input order.
 
-        return combined_image
+        The model stays in this process, pairs run one after another and reuse
+        the target features while the first image does not change. Images may
+        be given as file paths.
+        """
+        for src1, src2 in pairs:
+            kptsA, kptsB, _ = self.match(
+                _load_image(src1), _load_image(src2), mask, ransac, camera
+            )
+            yield kptsA, kptsB
 
 
 class KpMatchAlgo:
-    def __init__(self, kp_extractor: str = "SIFT", match_threshold=0.75) -> None:
+    def __init__(
+        self,
+        kp_extractor: str = "SIFT",
+        match_threshold=0.75,
+        cache_target=True,
+        matcher: str = "auto",
+        matcher_params: dict = None,
+        cross_check: bool = False,
+        visualize=False,
+        render_rate=10.0,
+        max_matches: int = None,
+        select_grid=(8, 8),
+        seed=0,
+        pyramid_scale: float = None,
+        feature_cache_size: int = 0,
+    ) -> None:
+        """
+        Args:
+            matcher (str): descriptor matcher backend, "auto", "bf", "bf_hamming",
+                "flann_kdtree" or "flann_lsh", see ``create_matcher_backend``.
+            matcher_params (dict, optional): backend parameters, e.g. trees and checks
+                of the KD-tree or table_number and key_size of LSH.
+            cross_check (bool): keep mutual nearest neighbours instead of the ratio test.
+            visualize (bool or str): False returns no match image, True draws it in
+                ``match``, "async" draws it on a ``MatchRenderer`` thread at ``render_rate``.
+            max_matches (int, optional): match budget, the matches with the smallest
+                descriptor distance are kept spread over a ``select_grid`` of image
+                cells, None keeps all.
+            pyramid_scale (float, optional): detect and match on images downscaled
+                by this factor, then refine the current keypoints at full resolution
+                with ``refine_matches``. Keypoints are returned in full resolution pixels.
+            feature_cache_size (int): number of images whose features are kept in an
+                LRU cache, for images that appear in several pairs. 0 disables it.
+        """
+        # everything needed to rebuild the matcher in a worker process
+        self._config = dict(
+            kp_extractor=kp_extractor,
+            match_threshold=match_threshold,
+            cache_target=cache_target,
+            matcher=matcher,
+            matcher_params=matcher_params,
+            cross_check=cross_check,
+            max_matches=max_matches,
+            select_grid=select_grid,
+            seed=seed,
+            pyramid_scale=pyramid_scale,
+        )
         self.match_threshold = match_threshold
+        self.pyramid_scale = pyramid_scale
+        self.max_matches = max_matches
+        self.select_grid = select_grid
+        self.seed = seed
         self.kp_extractor = self._parser_kp_extractor(kp_extractor)
-        self.matcher = cv2.FlannBasedMatcher()
+        self.matcher = create_matcher_backend(
+            matcher, self.kp_extractor, cross_check=cross_check, **(matcher_params or {})
+        )
+        self.cache_target = cache_target
+        self._target = None
+        self.feature_cache_size = feature_cache_size
+        self._feature_cache = OrderedDict()
+        self.visualize = visualize
+        self.renderer = MatchRenderer(render_rate).start() if visualize == "async" else None
 
     def _parser_kp_extractor(self, kp_extractor_str: str = "SIFT"):
         kp_extractor = "cv2." + kp_extractor_str.upper() + "_create"
@@ -105,6 +335,59 @@ class KpMatchAlgo:
         kp2, des2 = self.kp_extractor.detectAndCompute(img2, None)
         return kp1, des1, kp2, des2
 
+    def set_target(self, img: np.ndarray):
+        """Extract the target features once and build the matcher index on them.
+
+        ``match`` reuses them for every call whose first image has the same content.
+        """
+        assert img is not None, "Target Image not provided"
+        key = image_key(img)
+        kp, des = self._detect(img, key)
+        trained = des is not None and len(des) >= 2
+        if trained:
+            self.matcher.train(des)
+        self._target = {
+            "key": key,
+            "kp": kp,
+            "pts": self._kp_to_pixels(kp),
+            "des": des,
+            "trained": trained,
+            "gray": None if self.pyramid_scale is None else to_gray(img),
+        }
+
+    def _detect(self, img: np.ndarray, key=None):
+        """Detect and describe ``img`` on the matching level, through the feature cache."""
+        if self.feature_cache_size <= 0:
+            return self.kp_extractor.detectAndCompute(
+                downscale(img, self.pyramid_scale), None
+            )
+        key = image_key(img) if key is None else key
+        features = self._feature_cache.get(key)
+        if features is None:
+            features = self.kp_extractor.detectAndCompute(
+                downscale(img, self.pyramid_scale), None
+            )
+            self._feature_cache[key] = features
+            if len(self._feature_cache) > self.feature_cache_size:
+                self._feature_cache.popitem(last=False)
+        else:
+            self._feature_cache.move_to_end(key)
+        return features
+
+    def _kp_to_pixels(self, kp):
+        """Keypoint coordinates in full resolution pixels."""
+        if len(kp) == 0:
+            return np.empty((0, 2), np.float32)
+        pts = cv2.KeyPoint_convert(kp).reshape(-1, 2)
+        if self.pyramid_scale is not None:
+            pts = pts / self.pyramid_scale
+        return pts
+
+    def _get_target(self, img: np.ndarray):
+        if self._target is None or image_key(img) != self._target["key"]:
+            self.set_target(img)
+        return self._target
+
     def match(
         self,
         img1: np.ndarray,
@@ -115,69 +398,273 @@ class KpMatchAlgo:
     ):
         assert img1 is not None, "Color Image 1 not provided"
         assert img2 is not None, "Color Image 2 not provided"
-        kp1, des1, kp2, des2 = self._kp_extract(img1, img2)
-        matches = self.matcher.knnMatch(des1, des2, k=2)
-        good_matches = []
-        for m, n in matches:
-            if m.distance < self.match_threshold * n.distance:
-                good_matches.append([m])
-
-        if len(good_matches) < 3:
-            print("Too few matches :{}".format(len(good_matches)))
+        if self.cache_target:
+            target = self._get_target(img1)
+        else:
+            self.set_target(img1)
+            target = self._target
+        kp2, des2 = self._detect(img2)
+        if not target["trained"] or des2 is None:
+            print("Too few features")
             return None, None, None
-        kp1_array = np.array(
-            [kp1[good_matches[i][0].queryIdx].pt for i in range(len(good_matches))]
-        )
+        # the matcher is trained on the target, so the current image is the query side
+        cur_idx, tar_idx, dist = self.matcher.match(des2, self.match_threshold)
 
-        kp2_array = np.array(
-            [kp2[good_matches[i][0].trainIdx].pt for i in range(len(good_matches))]
+        if cur_idx.shape[0] < 3:
+            print("Too few matches :{}".format(cur_idx.shape[0]))
+            return None, None, None
+        kp1_array = target["pts"][tar_idx].astype(np.float64)
+        kp2_array = self._kp_to_pixels(kp2)[cur_idx].astype(np.float64)
+        if self.pyramid_scale is not None:
+            keep, kp2_array = refine_matches(
+                target["gray"], to_gray(img2), kp1_array, kp2_array, self.pyramid_scale
+            )
+            kp1_array, kp2_array, dist = kp1_array[keep], kp2_array[keep], dist[keep]
+        keep = self._filter_matches(kp1_array, kp2_array, mask, ransac, camera)
+        kp1_array = kp1_array[keep]
+        kp2_array = kp2_array[keep]
+        samples = select_matches(
+            kp2_array,
+            img2.shape,
+            self.max_matches,
+            dist[keep],
+            self.select_grid,
+            higher_is_better=False,
+            seed=self.seed,
         )
+        kp1_array = kp1_array[samples]
+        kp2_array = kp2_array[samples]
+
+        match_img = self._draw_matches(img1, kp1_array, img2, kp2_array)
+        return kp1_array, kp2_array, match_img
+
+    def match_many(
+        self,
+        pairs,
+        mask=None,
+        ransac: bool = True,
+        camera: Camera = None,
+        num_workers: int = None,
+        chunk_size: int = 8,
+        block_size: int = 256,
+        feature_cache_size: int = 64,
+    ):
+        """Match many (img1, img2) pairs on a process pool.
+
+        Pairs are read lazily in blocks of ``block_size``. Inside a block, pairs with
+        the same first image are grouped so a worker reuses its target index, and
+        every worker keeps the features of its last ``feature_cache_size`` images.
+        At most two blocks are in flight, which bounds memory for any number of pairs.
+        Workers build a ``KpMatchAlgo`` with this matcher's settings and no
+        visualization.
+
+        Args:
+            pairs (iterable): (img1, img2) tuples of images or image file paths.
+                Paths are cheaper to send to the workers.
+            camera (Camera, optional): intrinsics for the RANSAC filter. Only the
+                parameters are sent to the workers.
+            num_workers (int, optional): pool size, defaults to the CPU count. 0 matches
+                in this process.
+
+        Yields:
+            tuple: (tar_kp, cur_kp) per pair in input order, (None, None) if a pair
+                has too few matches.
+        """
+        if camera is not None:
+            params = Camera()
+            params.set_param(
+                camera.fx,
+                camera.fy,
+                camera.cx,
+                camera.cy,
+                camera.width,
+                camera.height,
+                camera.distortion,
+            )
+            camera = params
+        if num_workers == 0:
+            for src1, src2 in pairs:
+                # pairs are independent, so bypass the tracking of subclasses
+                tar_kp, cur_kp, _ = KpMatchAlgo.match(
+                    self, _load_image(src1), _load_image(src2), mask, ransac, camera
+                )
+                yield tar_kp, cur_kp
+            return
+
+        config = dict(self._config, feature_cache_size=feature_cache_size)
+        with ProcessPoolExecutor(
+            num_workers,
+            initializer=_init_match_worker,
+            initargs=(config, mask, ransac, camera),
+        ) as pool:
+            in_flight = deque()
+            for positions, block in _group_blocks(pairs, block_size):
+                futures = [
+                    pool.submit(_match_chunk, block[i : i + chunk_size])
+                    for i in range(0, len(block), chunk_size)
+                ]
+                in_flight.append((positions, futures))
+                if len(in_flight) > 1:
+                    yield from self._collect_block(*in_flight.popleft())
+            while in_flight:
+                yield from self._collect_block(*in_flight.popleft())
+
+    @staticmethod
+    def _collect_block(positions, futures):
+        results = [None] * len(positions)
+        sorted_results = [result for future in futures for result in future.result()]
+        for position, result in zip(positions, sorted_results):
+            results[position] = result
+        yield from results
+
+    def _filter_matches(
+        self, kp1_array, kp2_array, mask=None, ransac=True, camera: Camera = None
+    ):
+        """Boolean array of the matches kept by the mask and RANSAC filters."""
+        keep = np.ones(kp1_array.shape[0], bool)
         if mask is not None:
-            kp1_array_int = kp1_array.round().astype(int)
-            kp2_array_int = kp2_array.round().astype(int)
+            h, w = mask.shape[:2]
+            kp1_array_int = np.clip(kp1_array.round().astype(int), 0, [w - 1, h - 1])
+            kp2_array_int = np.clip(kp2_array.round().astype(int), 0, [w - 1, h - 1])
 
             x1, y1 = kp1_array_int[:, 0], kp1_array_int[:, 1]
             x2, y2 = kp2_array_int[:, 0], kp2_array_int[:, 1]
-            mask = mask[y1, x1] & mask[y2, x2]
-            mask = ~mask
-            kp1_array = kp1_array[mask]
-            kp2_array = kp2_array[mask]
-            mask_indices = np.where(mask)[0]
-            good_matches = [good_matches[i] for i in mask_indices]
-
-        if len(good_matches) > 4 and ransac:
-            _, mask = cv2.findEssentialMat(
-                kp1_array.reshape(-1, 1, 2),
-                kp2_array.reshape(-1, 1, 2),
+            keep &= ~(mask[y1, x1] & mask[y2, x2])
+
+        if keep.sum() > 4 and ransac:
+            _, ransac_mask = cv2.findEssentialMat(
+                kp1_array[keep].reshape(-1, 1, 2),
+                kp2_array[keep].reshape(-1, 1, 2),
                 camera.intrinsics_matrix,
                 cv2.RANSAC,
                 0.999,
                 3.0,
             )
-            mask = mask.ravel().astype(bool)
-            kp1_array = kp1_array[mask].reshape(-1, 2)
-            kp2_array = kp2_array[mask].reshape(-1, 2)
-            mask_indices = np.where(mask)[0]
-            good_matches = [good_matches[i] for i in mask_indices]
+            if ransac_mask is not None:
+                keep[keep] = ransac_mask.ravel().astype(bool)
+        return keep
 
-        match_img = cv2.drawMatchesKnn(
+    def _draw_matches(self, img1, kp1_array, img2, kp2_array):
+        return visualize_matches(
+            self.visualize,
+            self.renderer,
             img1,
-            kp1,
+            kp1_array,
             img2,
-            kp2,
-            good_matches,
-            None,
-            flags=cv2.DrawMatchesFlags_DEFAULT,
+            kp2_array,
+            [f"Matched Features: {kp1_array.shape[0]}"],
         )
 
-        cv2.putText(
-            match_img,
-            f"Matched Features: {len(good_matches)}",
-            (10, 30),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            0.8,
-            (0, 0, 0),
-            2,
+
+class KpTrackAlgo(KpMatchAlgo):
+    """Match against the target once, then track the current keypoints frame to frame.
+
+    Current keypoints are propagated with pyramidal Lucas-Kanade optical flow and
+    checked for forward-backward consistency. Features are detected and matched
+    again when fewer than ``min_tracked`` points, or less than ``min_track_ratio``
+    of the points of the last detection, survive, and every ``redetect_every``
+    frames so that the flow drift stays bounded.
+    """
+
+    def __init__(
+        self,
+        kp_extractor: str = "SIFT",
+        match_threshold=0.75,
+        *args,
+        min_tracked=30,
+        min_track_ratio=0.5,
+        fb_threshold=1.0,
+        win_size=(21, 21),
+        max_level=3,
+        redetect_every=5,
+        **kwargs,
+    ) -> None:
+        """
+        Args:
+            redetect_every (int, optional): maximum track age in frames before the
+                keypoints are matched against the target again, None to only
+                re-detect when too few points survive.
+        """
+        super().__init__(kp_extractor, match_threshold, *args, **kwargs)
+        self.min_tracked = min_tracked
+        self.redetect_every = redetect_every
+        self.min_track_ratio = min_track_ratio
+        self.fb_threshold = fb_threshold
+        self.lk_params = dict(
+            winSize=win_size,
+            maxLevel=max_level,
+            criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 30, 0.01),
         )
+        self.num_detections = 0
+        self._track = None
 
-        return kp1_array, kp2_array, match_img
+    def reset(self):
+        self._track = None
+
+    def _track_points(self, gray):
+        track = self._track
+        p0 = track["cur_pts"].astype(np.float32).reshape(-1, 1, 2)
+        p1, status, _ = cv2.calcOpticalFlowPyrLK(
+            track["prev_gray"], gray, p0, None, **self.lk_params
+        )
+        p0_back, status_back, _ = cv2.calcOpticalFlowPyrLK(
+            gray, track["prev_gray"], p1, None, **self.lk_params
+        )
+        h, w = gray.shape[:2]
+        p1 = p1.reshape(-1, 2)
+        fb_error = np.linalg.norm(p0 - p0_back, axis=-1).ravel()
+        keep = status.ravel().astype(bool) & status_back.ravel().astype(bool)
+        keep &= fb_error < self.fb_threshold
+        keep &= (p1[:, 0] >= 0) & (p1[:, 0] <= w - 1)
+        keep &= (p1[:, 1] >= 0) & (p1[:, 1] <= h - 1)
+        return keep, p1.astype(np.float64)
+
+    def match(
+        self,
+        img1: np.ndarray,
+        img2: np.ndarray,
+        mask=None,
+        ransac: bool = True,
+        camera: Camera = None,
+    ):
+        assert img1 is not None, "Color Image 1 not provided"
+        assert img2 is not None, "Color Image 2 not provided"
+        gray = to_gray(img2)
+        target_key = image_key(img1)
+        track = self._track
+        expired = (
+            track is not None
+            and self.redetect_every is not None
+            and track["age"] >= self.redetect_every
+        )
+        if track is not None and track["target_key"] == target_key and not expired:
+            keep, cur_pts = self._track_points(gray)
+            tar_pts = track["tar_pts"][keep]
+            cur_pts = cur_pts[keep]
+            keep = self._filter_matches(tar_pts, cur_pts, mask, ransac, camera)
+            tar_pts, cur_pts = tar_pts[keep], cur_pts[keep]
+            # never above the points of the last detection, which would re-detect always
+            min_tracked = min(
+                max(self.min_tracked, self.min_track_ratio * track["num_init"]),
+                track["num_init"],
+            )
+            if tar_pts.shape[0] >= min_tracked:
+                track.update({"prev_gray": gray, "tar_pts": tar_pts, "cur_pts": cur_pts})
+                track["age"] += 1
+                match_img = self._draw_matches(img1, tar_pts, img2, cur_pts)
+                return tar_pts, cur_pts, match_img
+
+        tar_pts, cur_pts, match_img = super().match(img1, img2, mask, ransac, camera)
+        self.num_detections += 1
+        if tar_pts is None:
+            self._track = None
+        else:
+            self._track = {
+                "target_key": target_key,
+                "prev_gray": gray,
+                "tar_pts": tar_pts,
+                "cur_pts": cur_pts,
+                "num_init": tar_pts.shape[0],
+                "age": 0,
+            }
+        return tar_pts, cur_pts, match_img
@@ -0,0 +1,58 @@
+import numpy as np
+
+
+def grid_cells(pts: np.ndarray, image_shape, grid=(8, 8)) -> np.ndarray:
+    """Flat index of the grid cell (rows x cols) every (x, y) point falls into."""
+    h, w = image_shape[:2]
+    rows, cols = grid
+    col = np.clip((pts[:, 0] * cols / w).astype(int), 0, cols - 1)
+    row = np.clip((pts[:, 1] * rows / h).astype(int), 0, rows - 1)
+    return row * cols + col
+
+
+def select_matches(
+    pts: np.ndarray,
+    image_shape,
+    budget: int = 200,
+    scores: np.ndarray = None,
+    grid=(8, 8),
+    higher_is_better: bool = True,
+    seed=0,
+) -> np.ndarray:
+    """Indices of at most ``budget`` matches spread evenly over the image.
+
+    Points are bucketed into a ``grid`` of cells and taken round-robin: the best
+    match of every cell first, then the second best of every cell, and so on.
+    Within a round the better scored matches win when the budget runs out.
+    Without ``scores`` the order inside a cell is random, drawn from ``seed``
+    so the selection is reproducible.
+
+    Args:
+        pts (np.ndarray): (N, 2) pixel coordinates used for bucketing.
+        image_shape (tuple): shape of the image the points belong to.
+        scores (np.ndarray, optional): (N,) match quality, e.g. certainty or
+            descriptor distance (with ``higher_is_better=False``).
+
+    Returns:
+        np.ndarray: sorted indices into ``pts``.
+    """
+    num = pts.shape[0]
+    if budget is None or num <= budget:
+        return np.arange(num)
+    rng = np.random.default_rng(seed)
+    # random tie break, also the order of the unscored case
+    key = rng.random(num)
+    if scores is not None:
+        scores = np.asarray(scores, np.float64)
+        key = np.lexsort((key, -scores if higher_is_better else scores))
+        key = np.argsort(key)
+    cells = grid_cells(pts, image_shape, grid)
+
+    order = np.lexsort((key, cells))
+    sorted_cells = cells[order]
+    first = np.searchsorted(sorted_cells, sorted_cells, side="left")
+    rank = np.empty(num, int)
+    rank[order] = np.arange(num) - first
+
+    selected = np.lexsort((key, rank))[:budget]
+    return np.sort(selected)
@@ -0,0 +1,148 @@
+import time
+import logging
+import threading
+import cv2
+import numpy as np
+
+PALETTE = [
+    (255, 0, 0),
+    (0, 255, 0),
+    (0, 0, 255),
+    (255, 255, 0),
+    (255, 0, 255),
+    (0, 255, 255),
+    (255, 128, 0),
+    (128, 0, 255),
+]
+_MARKER = np.array([[-2, -2], [2, -2], [2, 2], [-2, 2]], np.int32)
+
+
+def draw_matches(img1, kp1, img2, kp2, texts=None) -> np.ndarray:
+    """Draw matched keypoints side by side.
+
+    Lines and markers are grouped by color, so drawing costs one ``cv2.polylines``
+    call per palette color instead of one call per match.
+    """
+    img1_height, img1_width = img1.shape[:2]
+    img2_height, img2_width = img2.shape[:2]
+    combined_image = np.zeros(
+        (max(img1_height, img2_height), img1_width + img2_width, 3), dtype=np.uint8
+    )
+    if img1.ndim == 2:
+        img1 = cv2.cvtColor(img1, cv2.COLOR_GRAY2BGR)
+    if img2.ndim == 2:
+        img2 = cv2.cvtColor(img2, cv2.COLOR_GRAY2BGR)
+    combined_image[:img1_height, :img1_width] = img1
+    combined_image[:img2_height, img1_width:] = img2
+
+    if kp1 is not None and len(kp1) > 0:
+        points1 = np.round(kp1).astype(np.int32)
+        points2 = np.round(kp2).astype(np.int32) + [img1_width, 0]
+        lines = np.stack([points1, points2], axis=1)
+        markers = np.concatenate([points1, points2])[:, None, :] + _MARKER
+        line_colors = np.arange(lines.shape[0]) % len(PALETTE)
+        marker_colors = np.concatenate([line_colors, line_colors])
+        for i, color in enumerate(PALETTE):
+            cv2.polylines(combined_image, lines[line_colors == i], False, color, 1)
+            cv2.polylines(combined_image, markers[marker_colors == i], True, color, 1)
+
+    for i, text in enumerate(texts or []):
+        cv2.putText(
+            combined_image,
+            text,
+            (10, 30 * (i + 1)),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.8,
+            (0, 0, 0),
+            2,
+        )
+    return combined_image
+
+
+class MatchRenderer:
+    """Draw match images on a background thread at its own, lower rate.
+
+    ``submit`` only stores references to the latest match data and returns
+    immediately; older pending data is overwritten. ``latest`` returns the last
+    rendered image, which may lag behind the control loop.
+    """
+
+    def __init__(self, rate=10.0, window_name=None) -> None:
+        self.rate = rate
+        self.window_name = window_name
+        self._job = None
+        self._texts = None
+        self._image = None
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+        self.submitted = 0
+        self.rendered = 0
+
+    def start(self):
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._render_loop, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._thread.join()
+        self._thread = None
+        logging.info(
+            f"Match renderer stopped, submitted: {self.submitted}, rendered: {self.rendered}"
+        )
+
+    def submit(self, img1, kp1, img2, kp2, texts=None):
+        with self._cond:
+            self._texts = list(texts or [])
+            self._job = (img1, kp1, img2, kp2, self._texts)
+            self.submitted += 1
+            self._cond.notify_all()
+
+    def annotate(self, text: str):
+        """Add a text line to the last submitted match image."""
+        with self._cond:
+            if self._texts is not None:
+                self._texts.append(text)
+
+    def latest(self):
+        with self._cond:
+            return self._image
+
+    def _render_loop(self):
+        period = 1.0 / self.rate
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._job is not None or not self._running)
+                if not self._running:
+                    break
+                job, self._job = self._job, None
+            start = time.perf_counter()
+            image = draw_matches(*job)
+            with self._cond:
+                self._image = image
+                self.rendered += 1
+            if self.window_name is not None:
+                cv2.imshow(self.window_name, image)
+                cv2.waitKey(1)
+            time.sleep(max(0.0, period - (time.perf_counter() - start)))
+
+
+def visualize_matches(visualize, renderer, img1, kp1, img2, kp2, texts=None):
+    """Match image for the matchers' ``visualize`` setting.
+
+    False returns None, True draws synchronously, "async" hands the data to
+    ``renderer`` and returns its latest rendered image.
+    """
+    if visualize == "async":
+        renderer.submit(img1, kp1, img2, kp2, texts)
+        return renderer.latest()
+    elif visualize:
+        return draw_matches(img1, kp1, img2, kp2, texts)
+    return None
@@ -0,0 +1,148 @@
+from abc import ABC, abstractmethod
+import cv2
+import numpy as np
+
+FLANN_INDEX_KDTREE = 1
+FLANN_INDEX_LSH = 6
+
+
+class MatcherBackend(ABC):
+    """Descriptor matcher returning neighbours as arrays instead of DMatch lists.
+
+    ``train`` builds the index on the train (target) descriptors once, ``match``
+    queries it with either a Lowe ratio test or, with ``cross_check``, mutual
+    nearest neighbours.
+    """
+
+    def __init__(self, cross_check: bool = False) -> None:
+        self.cross_check = cross_check
+        self._des = None
+        self._index = None
+
+    @abstractmethod
+    def _build(self, des: np.ndarray):
+        pass
+
+    @abstractmethod
+    def _search(self, index, des: np.ndarray, k: int):
+        """Return (idx, dist) arrays of shape (N, k), missing neighbours have idx -1."""
+        pass
+
+    def train(self, des: np.ndarray) -> None:
+        self._des = des
+        self._index = self._build(des)
+
+    @property
+    def num_train(self) -> int:
+        return 0 if self._des is None else len(self._des)
+
+    def knn(self, des: np.ndarray, k: int = 2):
+        assert self._index is not None, "Matcher is not trained"
+        return self._search(self._index, des, k)
+
+    def match(self, des: np.ndarray, ratio: float = 0.75):
+        """Return (query_idx, train_idx, distance) arrays of the accepted matches."""
+        if self.cross_check:
+            idx, dist = self.knn(des, 1)
+            train_idx, dist = idx[:, 0], dist[:, 0]
+            rev_idx, _ = self._search(self._build(des), self._des, 1)
+            valid = train_idx >= 0
+            valid[valid] = rev_idx[train_idx[valid], 0] == np.flatnonzero(valid)
+        else:
+            idx, dist = self.knn(des, 2)
+            valid = (idx[:, 0] >= 0) & (idx[:, 1] >= 0)
+            valid &= dist[:, 0] < ratio * dist[:, 1]
+            train_idx, dist = idx[:, 0], dist[:, 0]
+        return np.flatnonzero(valid), train_idx[valid], dist[valid]
+
+
+class BruteForceBackend(MatcherBackend):
+    def __init__(self, norm=cv2.NORM_L2, cross_check: bool = False) -> None:
+        super().__init__(cross_check)
+        self.norm = norm
+
+    def _build(self, des):
+        return des
+
+    def _search(self, index, des, k):
+        binary = self.norm in (cv2.NORM_HAMMING, cv2.NORM_HAMMING2)
+        dist, idx = cv2.batchDistance(
+            des,
+            index,
+            cv2.CV_32S if binary else cv2.CV_32F,
+            normType=self.norm,
+            K=k,
+        )
+        return idx, dist.astype(np.float32)
+
+
+class FlannKDTreeBackend(MatcherBackend):
+    def __init__(self, trees=4, checks=32, cross_check: bool = False) -> None:
+        super().__init__(cross_check)
+        self.index_params = dict(algorithm=FLANN_INDEX_KDTREE, trees=trees)
+        self.search_params = dict(checks=checks)
+
+    def _build(self, des):
+        if des.dtype != np.float32:
+            raise ValueError(
+                "FLANN KD-tree needs float descriptors, use bf or flann_lsh for binary ones"
+            )
+        return cv2.flann_Index(des, self.index_params)
+
+    def _search(self, index, des, k):
+        idx, dist = index.knnSearch(des, k, params=self.search_params)
+        # the KD-tree reports squared L2 distances
+        return idx, np.sqrt(dist)
+
+
+class FlannLSHBackend(MatcherBackend):
+    def __init__(
+        self,
+        table_number=6,
+        key_size=12,
+        multi_probe_level=1,
+        checks=32,
+        cross_check: bool = False,
+    ) -> None:
+        super().__init__(cross_check)
+        self.index_params = dict(
+            algorithm=FLANN_INDEX_LSH,
+            table_number=table_number,
+            key_size=key_size,
+            multi_probe_level=multi_probe_level,
+        )
+        self.search_params = dict(checks=checks)
+
+    def _build(self, des):
+        if des.dtype != np.uint8:
+            raise ValueError("FLANN LSH needs binary descriptors, use flann_kdtree or bf")
+        return cv2.flann_Index(des, self.index_params)
+
+    def _search(self, index, des, k):
+        idx, dist = index.knnSearch(des, k, params=self.search_params)
+        return idx, dist.astype(np.float32)
+
+
+def create_matcher_backend(matcher: str, kp_extractor, **kwargs) -> MatcherBackend:
+    """Create a matcher backend by name.
+
+    ``auto`` picks brute-force Hamming for binary descriptors (ORB, BRISK, AKAZE)
+    and a FLANN KD-tree for float descriptors (SIFT, KAZE).
+    """
+    norm = kp_extractor.defaultNorm()
+    binary = norm in (cv2.NORM_HAMMING, cv2.NORM_HAMMING2)
+    if matcher == "auto":
+        matcher = "bf" if binary else "flann_kdtree"
+    if matcher == "bf":
+        return BruteForceBackend(norm, **kwargs)
+    elif matcher == "bf_hamming":
+        if not binary:
+            raise ValueError(
+                "bf_hamming needs binary descriptors, use bf or flann_kdtree for float ones"
+            )
+        return BruteForceBackend(norm, **kwargs)
+    elif matcher == "flann_kdtree":
+        return FlannKDTreeBackend(**kwargs)
+    elif matcher == "flann_lsh":
+        return FlannLSHBackend(**kwargs)
+    raise ValueError(f"Invalid matcher backend: {matcher}")
@@ -0,0 +1,68 @@
+import cv2
+import numpy as np
+
+
+def to_gray(img: np.ndarray) -> np.ndarray:
+    if img.ndim == 3:
+        return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return img
+
+
+def downscale(img: np.ndarray, scale=None) -> np.ndarray:
+    """Resize ``img`` by ``scale``, None or 1 returns it unchanged."""
+    if scale is None or scale == 1:
+        return img
+    return cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+def refine_matches(
+    gray1: np.ndarray,
+    gray2: np.ndarray,
+    pts1: np.ndarray,
+    pts2: np.ndarray,
+    scale: float,
+    win_size=(11, 11),
+    ransac_threshold=1.0,
+):
+    """Refine matches found on a downscaled level at full resolution.
+
+    Outliers are first removed with a fundamental matrix estimated from the
+    coarse matches. Each remaining ``pts2`` is then refined by Lucas-Kanade in
+    a local window around its coarse position, tracking the patch at ``pts1``.
+    Refinements that move further than one coarse pixel are dropped.
+
+    Args:
+        pts1, pts2 (np.ndarray): (N, 2) coarse matches in full resolution pixels.
+        scale (float): scale of the level the matches were found on.
+        ransac_threshold (float): fundamental matrix threshold in coarse pixels.
+
+    Returns:
+        tuple: boolean array of the kept matches and the refined (N, 2) ``pts2``.
+    """
+    keep = np.ones(pts1.shape[0], bool)
+    if pts1.shape[0] >= 8:
+        _, inliers = cv2.findFundamentalMat(
+            pts1 * scale, pts2 * scale, cv2.FM_RANSAC, ransac_threshold, 0.999
+        )
+        if inliers is not None:
+            keep = inliers.ravel().astype(bool)
+    if not keep.any():
+        return keep, pts2
+
+    p1 = pts1[keep].astype(np.float32).reshape(-1, 1, 2)
+    guess = pts2[keep].astype(np.float32).reshape(-1, 1, 2)
+    p2, status, _ = cv2.calcOpticalFlowPyrLK(
+        gray1,
+        gray2,
+        p1,
+        guess.copy(),
+        winSize=win_size,
+        maxLevel=0,
+        criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03),
+        flags=cv2.OPTFLOW_USE_INITIAL_FLOW,
+    )
+    shift = np.linalg.norm(p2 - guess, axis=-1).ravel()
+    refined = pts2.copy()
+    refined[keep] = p2.reshape(-1, 2)
+    keep[keep] = status.ravel().astype(bool) & (shift <= 1.0 / scale)
+    return keep, refined
@@ -0,0 +1,249 @@
+import time
+import logging
+import threading
+from collections import deque
+import numpy as np
+from ...device.sensor.frame_buffer import Frame, FrameBuffer
+
+
+class ServoRunner:
+    """Run capture, velocity computation and robot commands as overlapping stages.
+
+    Capture and computation each run on their own thread and hand over only the
+    newest item through single-slot buffers, so a slow stage never queues stale
+    work. The command thread sends ``applyTcpVel`` at a fixed ``rate`` with the
+    freshest velocity. A velocity older than ``stale_timeout`` seconds decays
+    exponentially with time constant ``decay`` (zero if None) until a new one
+    arrives.
+
+    Streaming ``RealSenseCamera`` instances are read from their own ring buffer,
+    any other camera is polled with ``get_frame`` on the capture thread.
+
+    Exceptions of the capture and compute stages are logged and counted in
+    ``failed``. After ``max_errors`` consecutive ones the runner stops itself,
+    commands zero velocity and ``stop`` re-raises the last exception.
+    """
+
+    def __init__(
+        self,
+        camera,
+        controller,
+        robot,
+        rate=125.0,
+        stale_timeout=0.2,
+        decay=0.1,
+        acc=1.0,
+        max_vel=None,
+        calc_vel_kwargs=None,
+        stats_size=1000,
+        max_errors=10,
+    ) -> None:
+        """
+        Args:
+            controller: visual servo controller with ``update`` and ``calc_vel``,
+                e.g. ``IBVS`` with the target already set.
+            robot (Manipulator): receives ``applyTcpVel(vel, acc)``.
+            rate (float): command rate in Hz.
+            max_vel (float, optional): clip the norm of the translational and the
+                rotational velocity to this value.
+            calc_vel_kwargs (dict, optional): forwarded to ``controller.calc_vel``.
+            max_errors (int): consecutive stage exceptions before the runner stops.
+        """
+        self.camera = camera
+        self.controller = controller
+        self.robot = robot
+        self.period = 1.0 / rate
+        self.stale_timeout = stale_timeout
+        self.decay = decay
+        self.acc = acc
+        self.max_vel = max_vel
+        self.calc_vel_kwargs = calc_vel_kwargs or {}
+        self.max_errors = max_errors
+
+        self._lock = threading.Lock()
+        self._running = False
+        self._threads = []
+        self._frames = None
+        self._result = None
+        self._vel = None
+        self._vel_stamp = None
+        self._error = None
+
+        self.capture_latency = deque(maxlen=stats_size)
+        self.compute_latency = deque(maxlen=stats_size)
+        self.command_latency = deque(maxlen=stats_size)
+        self.frame_age = deque(maxlen=stats_size)
+        self.commands = 0
+        self.stale_commands = 0
+        self.deadline_misses = 0
+        self.computed = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def start(self):
+        if self._running:
+            return self
+        self._running = True
+        self._error = None
+        if getattr(self.camera, "streaming", False):
+            self._frames = self.camera.frame_buffer
+        else:
+            self._frames = FrameBuffer(1)
+            self._threads.append(threading.Thread(target=self._capture_loop, daemon=True))
+        self._threads.append(threading.Thread(target=self._compute_loop, daemon=True))
+        self._threads.append(threading.Thread(target=self._command_loop, daemon=True))
+        for thread in self._threads:
+            thread.start()
+        logging.info(f"Servo runner started at {1.0 / self.period:.1f} Hz")
+        return self
+
+    def stop(self):
+        # the threads are joined also when the runner stopped itself on an error
+        if not self._threads:
+            return
+        self._running = False
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self.robot.applyTcpVel(np.zeros(6), self.acc)
+        if hasattr(self.robot, "stop"):
+            self.robot.stop()
+        logging.info(f"Servo runner stopped, stats: {self.stats()}")
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def latest(self):
+        """Newest (vel, score, match_img) of the controller, None before the first."""
+        with self._lock:
+            return self._result
+
+    def _stage_error(self, stage, error, errors):
+        """Log and count a stage exception, stop the runner after ``max_errors`` in a row."""
+        self.failed += 1
+        logging.exception(f"Servo runner {stage} failed: {error}")
+        if errors >= self.max_errors:
+            logging.error(f"Servo runner stopped after {errors} {stage} errors")
+            self._error = error
+            self._running = False
+
+    def _capture_loop(self):
+        frame_number = 0
+        errors = 0
+        while self._running:
+            start = time.perf_counter()
+            try:
+                color, depth = self.camera.get_frame()
+            except Exception as e:
+                errors += 1
+                self._stage_error("capture", e, errors)
+                continue
+            errors = 0
+            if color is None:
+                # e.g. a finished replay, stop feeding the controller
+                logging.info("Camera returned no frame, capture stopped")
+                break
+            self.capture_latency.append(time.perf_counter() - start)
+            now = time.time()
+            self._frames.push(Frame(color, depth, now, frame_number, now))
+            frame_number += 1
+
+    def _compute_loop(self):
+        errors = 0
+        while self._running:
+            if self._frames.next(timeout=0.1) is None:
+                continue
+            # skip to the newest frame if several arrived during the last step
+            frame = self._frames.latest()
+            start = time.perf_counter()
+            try:
+                self.controller.update(cur_img=frame.color, cur_depth=frame.depth)
+                result = self.controller.calc_vel(**self.calc_vel_kwargs)
+            except Exception as e:
+                errors += 1
+                self._stage_error("compute", e, errors)
+                continue
+            errors = 0
+            self.compute_latency.append(time.perf_counter() - start)
+            self.frame_age.append(time.time() - frame.host_timestamp)
+            if result[0] is None:
+                self.failed += 1
+                continue
+            self.computed += 1
+            with self._lock:
+                self._result = result
+                self._vel = np.asarray(result[0], np.float64)
+                self._vel_stamp = frame.host_timestamp
+
+    def _command_vel(self):
+        with self._lock:
+            vel, stamp = self._vel, self._vel_stamp
+        if vel is None:
+            return np.zeros(6)
+        age = time.time() - stamp
+        if age > self.stale_timeout:
+            self.stale_commands += 1
+            if self.decay is None:
+                return np.zeros(6)
+            vel = vel * np.exp(-(age - self.stale_timeout) / self.decay)
+        if self.max_vel is not None:
+            vel = vel.copy()
+            for part in (vel[:3], vel[3:]):
+                norm = np.linalg.norm(part)
+                if norm > self.max_vel:
+                    part *= self.max_vel / norm
+        return vel
+
+    def _command_loop(self):
+        deadline = time.perf_counter()
+        while self._running:
+            start = time.perf_counter()
+            self.robot.applyTcpVel(self._command_vel(), self.acc)
+            self.command_latency.append(time.perf_counter() - start)
+            self.commands += 1
+            deadline += self.period
+            remaining = deadline - time.perf_counter()
+            if remaining > 0:
+                time.sleep(remaining)
+            else:
+                # skip the missed slots instead of sending a burst
+                self.deadline_misses += 1
+                deadline = time.perf_counter()
+        if self._error is not None:
+            # stopped on a stage error, do not leave the last velocity running
+            self.robot.applyTcpVel(np.zeros(6), self.acc)
+
+    @staticmethod
+    def _latency_stats(samples) -> dict:
+        samples = np.array(samples) * 1000.0
+        if samples.size == 0:
+            return {}
+        return {
+            "mean_ms": float(samples.mean()),
+            "p95_ms": float(np.percentile(samples, 95)),
+            "max_ms": float(samples.max()),
+        }
+
+    def stats(self) -> dict:
+        """Per-stage latency and command statistics."""
+        return {
+            "capture": self._latency_stats(self.capture_latency),
+            "compute": self._latency_stats(self.compute_latency),
+            "command": self._latency_stats(self.command_latency),
+            "frame_age": self._latency_stats(self.frame_age),
+            "commands": self.commands,
+            "stale_commands": self.stale_commands,
+            "deadline_misses": self.deadline_misses,
+            "computed": self.computed,
+            "failed": self.failed,
+            "dropped_frames": 0 if self._frames is None else self._frames.dropped,
+        }
@@ -0,0 +1,318 @@
+import time
+import logging
+import cv2
+import numpy as np
+from scipy.spatial.transform import Rotation as R
+from ...device.sensor.camera import Camera
+from ...device.manipulator.manipulator_base import Manipulator
+from ..utils.transforms import velTransform
+
+
+def make_texture(size=(1024, 1024), seed=0) -> np.ndarray:
+    """Seeded multi-scale noise texture with enough corners for feature matching."""
+    rng = np.random.default_rng(seed)
+    h, w = size
+    texture = np.zeros((h, w, 3), np.float32)
+    for cells, weight in [(8, 0.5), (32, 0.3), (128, 0.2)]:
+        noise = rng.random((cells, cells, 3)).astype(np.float32)
+        texture += weight * cv2.resize(noise, (w, h), interpolation=cv2.INTER_CUBIC)
+    return np.clip(texture * 255, 0, 255).astype(np.uint8)
+
+
+def look_at_pose(position, target=(0.0, 0.0, 0.0), up=(0.0, 1.0, 0.0)) -> np.ndarray:
+    """Camera to world pose at ``position`` with the optical axis towards ``target``."""
+    position = np.asarray(position, np.float64)
+    z = np.asarray(target, np.float64) - position
+    z /= np.linalg.norm(z)
+    x = np.cross(np.asarray(up, np.float64), z)
+    x /= np.linalg.norm(x)
+    pose = np.eye(4)
+    pose[:3, :3] = np.stack([x, np.cross(z, x), z], axis=1)
+    pose[:3, 3] = position
+    return pose
+
+
+def pose_error(pose, target_pose):
+    """Translation (m) and rotation (rad) distance between two poses."""
+    trans_error = np.linalg.norm(pose[:3, 3] - target_pose[:3, 3])
+    rot_error = np.linalg.norm(
+        R.from_matrix(target_pose[:3, :3].T @ pose[:3, :3]).as_rotvec()
+    )
+    return float(trans_error), float(rot_error)
+
+
+class SimCamera(Camera):
+    """Virtual camera looking at a textured plane z = 0 of the world frame.
+
+    Every pixel ray, undistorted through the ray table, is intersected with the
+    plane and the texture is sampled with ``cv2.remap``, so distortion is
+    rendered too. Depth is returned in raw millimeter units like a RealSense
+    stream, 0 where the ray misses the texture.
+    """
+
+    def __init__(
+        self,
+        fx=600.0,
+        fy=600.0,
+        cx=320.0,
+        cy=240.0,
+        width=640,
+        height=480,
+        distortion=None,
+        texture=None,
+        plane_size=(0.6, 0.6),
+        pose=None,
+        depth_scale=0.001,
+    ):
+        super().__init__(width, height)
+        self.set_param(fx, fy, cx, cy, width, height, distortion)
+        self.texture = make_texture() if texture is None else texture
+        self.plane_size = plane_size
+        self.depth_scale = depth_scale
+        self.pose = look_at_pose([0.0, 0.0, 0.5]) if pose is None else pose
+
+    def render(self, pose=None):
+        """Render (color, raw depth) seen from the camera to world ``pose``."""
+        pose = self.pose if pose is None else pose
+        rays = self.ray_table
+        rot, pos = pose[:3, :3], pose[:3, 3]
+        # world frame direction of the ray (x, y, 1) and its plane intersection
+        dirs = rays @ rot[:, :2].T + rot[:, 2]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            depth = -pos[2] / dirs[..., 2]
+        th, tw = self.texture.shape[:2]
+        sx, sy = self.plane_size
+        map_x = ((pos[0] + depth * dirs[..., 0]) / sx + 0.5) * tw - 0.5
+        map_y = ((pos[1] + depth * dirs[..., 1]) / sy + 0.5) * th - 0.5
+        valid = (depth > 0) & (map_x >= 0) & (map_x <= tw - 1)
+        valid &= (map_y >= 0) & (map_y <= th - 1)
+        map_x = np.where(valid, map_x, -1).astype(np.float32)
+        map_y = np.where(valid, map_y, -1).astype(np.float32)
+        color = cv2.remap(
+            self.texture, map_x, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT
+        )
+        depth = np.where(valid, np.rint(depth / self.depth_scale), 0).astype(np.uint16)
+        return color, depth
+
+    def get_frame(self):
+        self.color_img, self.depth_img = self.render()
+        return self.color_img, self.raw_depth_img
+
+    def project(self, points_world: np.ndarray, pose=None):
+        """Float pixels of world points and whether they are visible."""
+        pose = self.pose if pose is None else pose
+        points = (points_world - pose[:3, 3]) @ pose[:3, :3]
+        pixels = self.projet(points, integer=False)
+        visible = (points[:, 2] > 0) & (pixels[:, 0] >= 0) & (pixels[:, 1] >= 0)
+        visible &= (pixels[:, 0] <= self.width - 1) & (pixels[:, 1] <= self.height - 1)
+        return pixels, visible
+
+
+class SimRobot(Manipulator):
+    """Robot whose tool is the simulated camera, integrating commanded twists.
+
+    ``applyTcpVel`` takes the twist in the camera (tool) frame like ``UR``,
+    rotates it to the world with ``velTransform`` and integrates the camera pose
+    over ``dt`` seconds, or over the wall-clock time since the last command if
+    ``dt`` is None.
+    """
+
+    def __init__(self, camera: SimCamera, dt=None) -> None:
+        self.camera = camera
+        self.dt = dt
+        self._last_command = None
+
+    @property
+    def world_pose(self) -> np.ndarray:
+        return self.camera.pose
+
+    @property
+    def tcp_pose(self) -> np.ndarray:
+        return self.camera.pose
+
+    def _integrate(self, world_vel, dt):
+        pose = self.camera.pose.copy()
+        pose[:3, 3] += world_vel[:3] * dt
+        pose[:3, :3] = R.from_rotvec(world_vel[3:] * dt).as_matrix() @ pose[:3, :3]
+        self.camera.pose = pose
+
+    def _step_time(self):
+        now = time.perf_counter()
+        if self.dt is not None:
+            dt = self.dt
+        elif self._last_command is None:
+            dt = 0.0
+        else:
+            dt = now - self._last_command
+        self._last_command = now
+        return dt
+
+    def applyTcpVel(self, tcp_vel, acc=1.0, time=0.0) -> None:
+        world_vel = velTransform(np.asarray(tcp_vel, np.float64), self.camera.pose[:3, :3])
+        self._integrate(world_vel, self._step_time())
+
+    def applyVel(self, vel, acc=1.0, time=0.0) -> None:
+        self.applyWorldVel(vel, acc, time)
+
+    def applyWorldVel(self, world_vel, acc=1.0, time=0.0) -> None:
+        self._integrate(np.asarray(world_vel, np.float64), self._step_time())
+
+    def moveToPose(self, pose, vel=0.25, acc=1.2, asynchronous=False):
+        self.camera.pose = np.array(pose, np.float64)
+        self._last_command = None
+
+    def moveToWorldPose(self, pose, vel=0.25, acc=1.2, asynchronous=False):
+        self.moveToPose(pose, vel, acc, asynchronous)
+
+    def stop(self, acc=10.0) -> None:
+        self._last_command = None
+
+
+class SimPointMatcher:
+    """Ideal matcher returning the exact projections of points on the textured plane.
+
+    Used as ``kp_algo`` to benchmark a controller separately from matching.
+    """
+
+    def __init__(self, camera: SimCamera, num_points=100, seed=0, noise=0.0) -> None:
+        rng = np.random.default_rng(seed)
+        sx, sy = camera.plane_size
+        self.camera = camera
+        self.points = np.zeros((num_points, 3))
+        self.points[:, 0] = rng.uniform(-sx / 2, sx / 2, num_points)
+        self.points[:, 1] = rng.uniform(-sy / 2, sy / 2, num_points)
+        self.noise = noise
+        self.rng = rng
+        self.target_pose = None
+        self.renderer = None
+
+    def match(self, img1, img2, mask=None, ransac=True, camera=None):
+        tar_kp, tar_visible = self.camera.project(self.points, self.target_pose)
+        cur_kp, cur_visible = self.camera.project(self.points)
+        visible = tar_visible & cur_visible
+        if visible.sum() < 3:
+            return None, None, None
+        cur_kp = cur_kp[visible]
+        if self.noise > 0:
+            cur_kp = cur_kp + self.rng.normal(0, self.noise, cur_kp.shape)
+        return tar_kp[visible], cur_kp, None
+
+
+def run_servo(
+    controller,
+    camera: SimCamera,
+    target_pose,
+    start_pose,
+    dt=0.05,
+    max_steps=300,
+    trans_tol=1e-3,
+    rot_tol=np.deg2rad(0.5),
+    calc_vel_kwargs=None,
+) -> dict:
+    """Close the loop between ``controller`` and a simulated camera and robot.
+
+    The target images are rendered at ``target_pose``, then the camera starts at
+    ``start_pose`` and every step renders, calls ``calc_vel`` and integrates the
+    velocity over ``dt``. Converged when the pose error is within the tolerances.
+
+    Returns:
+        dict: converged, steps, final translation and rotation error, failed
+            steps and controller milliseconds per step.
+    """
+    robot = SimRobot(camera, dt)
+    if isinstance(getattr(controller, "kp_algo", None), SimPointMatcher):
+        controller.kp_algo.target_pose = target_pose
+    robot.moveToPose(target_pose)
+    tar_img, tar_depth = camera.get_frame()
+    controller.update(tar_img=tar_img, tar_depth=tar_depth)
+    robot.moveToPose(start_pose)
+
+    converged = False
+    failed = 0
+    compute_time = 0.0
+    step = 0
+    for step in range(1, max_steps + 1):
+        cur_img, cur_depth = camera.get_frame()
+        controller.update(cur_img=cur_img, cur_depth=cur_depth)
+        start = time.perf_counter()
+        vel, _, _ = controller.calc_vel(**(calc_vel_kwargs or {}))
+        compute_time += time.perf_counter() - start
+        if vel is None:
+            failed += 1
+            continue
+        robot.applyTcpVel(vel)
+        trans_error, rot_error = pose_error(camera.pose, target_pose)
+        if trans_error < trans_tol and rot_error < rot_tol:
+            converged = True
+            break
+    trans_error, rot_error = pose_error(camera.pose, target_pose)
+    return {
+        "converged": converged,
+        "steps": step,
+        "trans_error": trans_error,
+        "rot_error": rot_error,
+        "failed": failed,
+        "ms_per_step": compute_time / max(step, 1) * 1000.0,
+    }
+
+
+def perturb_pose(pose, trans=0.05, rot=np.deg2rad(10), seed=0) -> np.ndarray:
+    """``pose`` moved by a random translation and rotation of the given norms."""
+    rng = np.random.default_rng(seed)
+    direction = rng.normal(size=3)
+    axis = rng.normal(size=3)
+    perturbed = np.array(pose, np.float64)
+    perturbed[:3, 3] += trans * direction / np.linalg.norm(direction)
+    perturbed[:3, :3] = (
+        R.from_rotvec(rot * axis / np.linalg.norm(axis)).as_matrix() @ perturbed[:3, :3]
+    )
+    return perturbed
+
+
+def benchmark_servo(
+    configs: dict,
+    camera: SimCamera = None,
+    target_pose=None,
+    num_trials=5,
+    trans=0.05,
+    rot=np.deg2rad(10),
+    seed=0,
+    **run_kwargs,
+) -> dict:
+    """Run every controller configuration from the same perturbed start poses.
+
+    Args:
+        configs (dict): name to a factory ``f(camera) -> controller``, e.g.
+            ``lambda cam: IBVS(cam, KpMatchAlgo, "ORB", gain=0.5)``.
+        run_kwargs: forwarded to ``run_servo``.
+
+    Returns:
+        dict: name to the per-trial results and their summary. Every trial uses a
+            new controller, so no tracking or scoring state leaks between trials.
+    """
+    camera = SimCamera() if camera is None else camera
+    target_pose = camera.pose.copy() if target_pose is None else target_pose
+    start_poses = [
+        perturb_pose(target_pose, trans, rot, seed + i) for i in range(num_trials)
+    ]
+    results = {}
+    for name, factory in configs.items():
+        trials = [
+            run_servo(factory(camera), camera, target_pose, start_pose, **run_kwargs)
+            for start_pose in start_poses
+        ]
+        converged = [trial for trial in trials if trial["converged"]]
+        summary = {
+            "success_rate": len(converged) / num_trials,
+            "mean_steps": (
+                float(np.mean([trial["steps"] for trial in converged]))
+                if converged
+                else None
+            ),
+            "mean_trans_error": float(np.mean([t["trans_error"] for t in trials])),
+            "mean_rot_error": float(np.mean([t["rot_error"] for t in trials])),
+            "ms_per_step": float(np.mean([t["ms_per_step"] for t in trials])),
+        }
+        results[name] = {"trials": trials, "summary": summary}
+        logging.info(f"{name}: {summary}")
+    return results
@@ -0,0 +1,184 @@
+from .. import kp_matcher
+from ....device.sensor.camera import Camera
+from ....device.sensor.depth_sampler import sample_depth
+import numpy as np
+import cv2
+from scipy.spatial.transform import Rotation as R
+from .vs_controller_base import VisualServoControllerBase
+
+
+def _skew(v):
+    return np.array([[0.0, -v[2], v[1]], [v[2], 0.0, -v[0]], [-v[1], v[0], 0.0]])
+
+
+class HBVS(VisualServoControllerBase):
+    """2.5D visual servo on the homography between the target and current keypoints.
+
+    The Euclidean homography of the matches, ``m ~ H m*`` in normalized image
+    coordinates, gives the rotation to the target view by decomposition and, for
+    a reference point ``m*`` on the plane, its current image position ``m`` and
+    depth ratio ``rho = Z / Z*``. The error is ``(x - x*, y - y*, log(rho), theta u)``
+    and the velocity is solved from its 6x6 interaction matrix, so the cost of
+    the control law does not depend on the number of keypoints. Only the target
+    depth ``Z*`` of the reference point is needed and it only scales the
+    translational gain.
+    """
+
+    def __init__(
+        self,
+        camera: Camera,
+        kp_algo=kp_matcher.KpMatchAlgo,
+        *args,
+        gain=1.0,
+        target_depth=None,
+        ransac_threshold=2.0,
+        **kwargs,
+    ) -> None:
+        """
+        Args:
+            gain (float): velocity gain.
+            target_depth (float, optional): depth of the reference point in the
+                target view in meters, the median target depth of the matches if None.
+            ransac_threshold (float): homography RANSAC threshold in pixels.
+            args, kwargs: forwarded to ``kp_algo``.
+        """
+        self.kp_algo = kp_algo(*args, **kwargs)
+        self.camera = camera
+        self.gain = gain
+        self.target_depth = target_depth
+        self.ransac_threshold = ransac_threshold
+        self.homography = None
+        self.error = None
+        self._L = np.zeros((6, 6))
+        self._reset_target()
+        self.cur_img = None
+        self.tar_img = None
+        self.cur_depth = None
+        self.tar_depth = None
+
+    def _reset_target(self):
+        self._ref = None
+        self._tar_z = None
+        self._normal = np.array([0.0, 0.0, 1.0])
+
+    def update(self, *args, **kwargs):
+        """Set the images, the target depth is only used without ``target_depth``."""
+        if "cur_img" in kwargs:
+            assert isinstance(
+                kwargs["cur_img"], np.ndarray
+            ), "Image should be a numpy array"
+            self.cur_img = kwargs["cur_img"]
+        if "tar_img" in kwargs:
+            assert isinstance(
+                kwargs["tar_img"], np.ndarray
+            ), "Image should be a numpy array"
+            self.tar_img = kwargs["tar_img"]
+            self._reset_target()
+        if "cur_depth" in kwargs:
+            self.cur_depth = kwargs["cur_depth"]
+        if "tar_depth" in kwargs:
+            assert isinstance(
+                kwargs["tar_depth"], np.ndarray
+            ), "Depth should be a numpy array"
+            self.tar_depth = kwargs["tar_depth"]
+            self._tar_z = None
+
+    def _target_z(self, tar_kp):
+        if self.target_depth is not None:
+            return self.target_depth
+        if self._tar_z is None:
+            assert self.tar_depth is not None, "Target depth not provided"
+            z, valid = sample_depth(self.tar_depth, tar_kp)
+            if not valid.any():
+                return None
+            self._tar_z = float(
+                np.median(self.camera.to_metric(z[valid], self.tar_depth.dtype))
+            )
+        return self._tar_z
+
+    def _select_rotation(self, H, tar_xy, cur_xy):
+        """Rotation of the decomposition with the plane in front of both views.
+
+        Of the two remaining solutions the one whose normal is closest to the
+        previous normal, initially the optical axis, is kept.
+        """
+        _, rotations, _, normals = cv2.decomposeHomographyMat(H, np.eye(3))
+        candidates = cv2.filterHomographyDecompByVisibleRefpoints(
+            rotations,
+            normals,
+            tar_xy.reshape(-1, 1, 2).astype(np.float32),
+            cur_xy.reshape(-1, 1, 2).astype(np.float32),
+        )
+        if candidates is None:
+            candidates = range(len(rotations))
+        best = max(
+            np.asarray(candidates).ravel(),
+            key=lambda i: float(normals[i].ravel() @ self._normal),
+        )
+        self._normal = normals[best].ravel()
+        return rotations[best]
+
+    def cal_vel_from_kp(self, tar_kp, cur_kp):
+        assert tar_kp.shape == cur_kp.shape, "Keypoints shape mismatch"
+        tar_xy = self.camera.pixel_to_camera_frame(tar_kp)
+        cur_xy = self.camera.pixel_to_camera_frame(cur_kp)
+        threshold = self.ransac_threshold / self.camera.intrinsics_matrix[0, 0]
+        H, inliers = cv2.findHomography(tar_xy, cur_xy, cv2.RANSAC, threshold)
+        if H is None:
+            return None
+        inliers = inliers.ravel().astype(bool)
+        if inliers.sum() < 4:
+            print("Too few homography inliers :{}".format(inliers.sum()))
+            return None
+        tar_xy, cur_xy = tar_xy[inliers], cur_xy[inliers]
+        tar_z = self._target_z(tar_kp[inliers])
+        if tar_z is None:
+            print("No valid target depth")
+            return None
+
+        # the Euclidean homography R + t n^T / d has a unit middle singular value
+        H = H / np.linalg.svd(H, compute_uv=False)[1]
+        if self._ref is None:
+            self._ref = np.append(tar_xy.mean(axis=0), 1.0)
+        ref = H @ self._ref
+        if ref[2] < 0:
+            H, ref = -H, -ref
+        self.homography = H
+        rho = ref[2]
+        x, y = ref[0] / rho, ref[1] / rho
+        # rotation of the current view in the target frame, X = R X* + t
+        theta_u = R.from_matrix(self._select_rotation(H, tar_xy, cur_xy).T).as_rotvec()
+
+        inv_z = 1.0 / (rho * tar_z)
+        L = self._L
+        L[:3, :3] = [[-inv_z, 0.0, x * inv_z], [0.0, -inv_z, y * inv_z], [0.0, 0.0, -inv_z]]
+        L[:3, 3:] = [[x * y, -1.0 - x * x, y], [1.0 + y * y, -x * y, -x], [-y, x, 0.0]]
+        theta = np.linalg.norm(theta_u)
+        L[3:, 3:] = np.eye(3)
+        if theta > 1e-9:
+            u = _skew(theta_u / theta)
+            sinc_ratio = np.sinc(theta / np.pi) / np.sinc(theta / (2 * np.pi)) ** 2
+            L[3:, 3:] += -0.5 * theta * u + (1.0 - sinc_ratio) * (u @ u)
+
+        self.error = np.array(
+            [x - self._ref[0], y - self._ref[1], np.log(rho), *theta_u]
+        )
+        return -self.gain * np.linalg.solve(L, self.error)
+
+    def calc_vel(self, mask=None):
+        """Return the camera twist, the error norm and the match image.
+
+        Returns None, None, match image when no homography is found.
+        """
+        assert (
+            self.kp_algo is not None and self.camera is not None
+        ), "KeyPoint Extractor or Camera not provided"
+        tar_kp, cur_kp, match_img = self.kp_algo.match(
+            self.tar_img, self.cur_img, mask, True, self.camera
+        )
+        if tar_kp is None or len(tar_kp) < 4:
+            return None, None, match_img
+        vel = self.cal_vel_from_kp(tar_kp, cur_kp)
+        if vel is None:
+            return None, None, match_img
+        return vel, float(np.linalg.norm(self.error)), match_img
@@ -1,17 +1,84 @@
 from .. import kp_matcher
 from ....device.sensor.camera import Camera
+from ....device.sensor.depth_sampler import sample_depth
 import numpy as np
 from ...utils import metric
+from ..pyramid import downscale
 import cv2
 from .vs_controller_base import VisualServoControllerBase
 
 
 class IBVS(VisualServoControllerBase):
     def __init__(
-        self, camera: Camera, kp_algo=kp_matcher.KpMatchAlgo, *args, **kwargs
+        self,
+        camera: Camera,
+        kp_algo=kp_matcher.KpMatchAlgo,
+        *args,
+        solver="lstsq",
+        gain=1.0,
+        damping=0.0,
+        robust=None,
+        irls_iters=3,
+        robust_scale=None,
+        depth_method="nearest",
+        depth_window=3,
+        score="ssim",
+        score_every=1,
+        score_scale=None,
+        score_roi=None,
+        **kwargs,
     ) -> None:
+        """
+        Args:
+            solver (str): "lstsq" solves the stacked (2N, 6) system by SVD, "normal"
+                solves the 6x6 normal equations, "qr" uses a QR factorization.
+            gain (float): velocity gain.
+            damping (float): Levenberg-Marquardt damping, not supported by "lstsq"
+                which falls back to the normal equations when it is set.
+            robust (str, optional): "huber" or "tukey" reweights the solve over
+                ``irls_iters`` iterations so that outlier matches lose influence.
+                The per keypoint weights of the returned velocity are kept in
+                ``weights``, None without ``robust``.
+            robust_scale (float, optional): residual scale in normalized image
+                coordinates, estimated from the median keypoint residual norm if None.
+            depth_method (str): keypoint depth sampling, "nearest", "bilinear",
+                "median" or "min" over a ``depth_window`` neighbourhood, see ``sample_depth``.
+            score (str): convergence score returned by ``calc_vel``. "ssim" is the SSIM
+                of the images, "ssim_cached" the same SSIM with the target statistics
+                computed once, "kp_error" the mean keypoint distance in pixels (lower
+                is better), "none" skips scoring and returns None.
+            score_every (int): compute the score every k steps and repeat the last
+                score in between.
+            score_scale (float, optional): downscale the images for the SSIM scores.
+            score_roi (tuple, optional): (x, y, w, h) region of the SSIM scores.
+            args, kwargs: forwarded to ``kp_algo``.
+        """
+        assert solver in ["lstsq", "normal", "qr"], "Invalid solver"
+        assert robust in [None, "huber", "tukey"], "Invalid robust loss"
+        assert score in ["ssim", "ssim_cached", "kp_error", "none"], "Invalid score"
         self.kp_algo = kp_algo(*args, **kwargs)
         self.camera = camera
+        self.solver = solver
+        self.gain = gain
+        self.damping = damping
+        self.robust = robust
+        self.irls_iters = irls_iters
+        self.robust_scale = robust_scale
+        self.weights = None
+        self.depth_method = depth_method
+        self.depth_window = depth_window
+        self.score = score
+        self.score_every = score_every
+        self.score_scale = score_scale
+        self.score_roi = score_roi
+        self._score_step = 0
+        self._last_score = None
+        self._target_stats = None
+        self._L_buf = None
+        self._e_buf = None
+        self._Lw_buf = None
+        self._H = np.empty((6, 6))
+        self._g = np.empty(6)
         self.cur_img = None
         self.tar_img = None
         self.cur_depth = None
@@ -28,6 +95,10 @@ class IBVS(VisualServoControllerBase):
                 kwargs["tar_img"], np.ndarray
             ), "Image should be a numpy array"
             self.tar_img = kwargs["tar_img"]
+            # the score of the previous target must not be repeated for the new one
+            self._target_stats = None
+            self._last_score = None
+            self._score_step = 0
         if "cur_depth" in kwargs:
             assert isinstance(
                 kwargs["cur_depth"], np.ndarray
@@ -39,51 +110,144 @@ class IBVS(VisualServoControllerBase):
             ), "Depth should be a numpy array"
             self.tar_depth = kwargs["tar_depth"]
 
+    def _buffers(self, num_kp):
+        """Views of the reused (2N, 6) interaction matrix and (2N,) error buffers.
+
+        The buffers grow geometrically and keep six spare rows for the damping
+        rows of the QR solve.
+        """
+        rows = 2 * num_kp
+        if self._L_buf is None or self._L_buf.shape[0] < rows + 6:
+            capacity = max(2 * rows, 128) + 6
+            self._L_buf = np.empty((capacity, 6))
+            self._e_buf = np.empty(capacity)
+            self._Lw_buf = np.empty((capacity, 6))
+        return self._L_buf[:rows], self._e_buf[:rows]
+
     def cal_vel_from_kp(self, tar_kp, cur_kp, tar_z, cur_z):
 
         assert tar_kp.shape == cur_kp.shape, "Keypoints shape mismatch"
         tar_kp = self.camera.pixel_to_camera_frame(tar_kp)
         cur_kp = self.camera.pixel_to_camera_frame(cur_kp)
         num_kp = tar_kp.shape[0]
+        cur_x, cur_y = cur_kp[:, 0], cur_kp[:, 1]
+        tar_x, tar_y = tar_kp[:, 0], tar_kp[:, 1]
+        cur_iz = 1.0 / np.asarray(cur_z, np.float64)
+        tar_iz = 1.0 / np.asarray(tar_z, np.float64)
+
+        # mean of the current and target interaction matrices, built in place
+        L, error = self._buffers(num_kp)
+        L_xy = L.reshape(num_kp, 2, 6)
+        L_x, L_y = L_xy[:, 0], L_xy[:, 1]
+        L_x[:, 0] = -0.5 * (cur_iz + tar_iz)
+        L_x[:, 1] = 0.0
+        L_x[:, 2] = 0.5 * (cur_x * cur_iz + tar_x * tar_iz)
+        L_x[:, 3] = 0.5 * (cur_x * cur_y + tar_x * tar_y)
+        L_x[:, 4] = -1.0 - 0.5 * (cur_x * cur_x + tar_x * tar_x)
+        L_x[:, 5] = 0.5 * (cur_y + tar_y)
+        L_y[:, 0] = 0.0
+        L_y[:, 1] = L_x[:, 0]
+        L_y[:, 2] = 0.5 * (cur_y * cur_iz + tar_y * tar_iz)
+        L_y[:, 3] = 1.0 + 0.5 * (cur_y * cur_y + tar_y * tar_y)
+        L_y[:, 4] = -L_x[:, 3]
+        L_y[:, 5] = -0.5 * (cur_x + tar_x)
+
+        error_xy = error.reshape(num_kp, 2)
+        np.subtract(tar_x, cur_x, out=error_xy[:, 0])
+        np.subtract(tar_y, cur_y, out=error_xy[:, 1])
+
+        self.weights = None
+        vel = self._solve(L, error)
+        if self.robust is not None:
+            vel = self._irls(L, error, vel)
+        return self.gain * vel
+
+    def _irls(self, L, error, vel):
+        """Iteratively reweighted least squares with per keypoint weights.
 
-        cur_x = cur_kp[:, 0]
-        cur_y = cur_kp[:, 1]
-
-        cur_L = np.zeros((num_kp * 2, 6), cur_kp.dtype)
-        cur_L[0::2, 0] = -1.0 / cur_z
-        cur_L[0::2, 2] = cur_x / cur_z
-        cur_L[0::2, 3] = cur_x * cur_y
-        cur_L[0::2, 4] = -(1 + cur_x * cur_x)
-        cur_L[0::2, 5] = cur_y
-        cur_L[1::2, 1] = -1.0 / cur_z
-        cur_L[1::2, 2] = cur_y / cur_z
-        cur_L[1::2, 3] = 1 + cur_y * cur_y
-        cur_L[1::2, 4] = -cur_x * cur_y
-        cur_L[1::2, 5] = -cur_x
-
-        tar_x = tar_kp[:, 0]
-        tar_y = tar_kp[:, 1]
-
-        tar_L = np.zeros((num_kp * 2, 6), tar_kp.dtype)
-        tar_L[0::2, 0] = -1.0 / tar_z
-        tar_L[0::2, 2] = tar_x / tar_z
-        tar_L[0::2, 3] = tar_x * tar_y
-        tar_L[0::2, 4] = -(1 + tar_x * tar_x)
-        tar_L[0::2, 5] = tar_y
-        tar_L[1::2, 1] = -1.0 / tar_z
-        tar_L[1::2, 2] = tar_y / tar_z
-        tar_L[1::2, 3] = 1 + tar_y * tar_y
-        tar_L[1::2, 4] = -tar_x * tar_y
-        tar_L[1::2, 5] = -tar_x
-
-        error = np.zeros(num_kp * 2, cur_kp.dtype)
-        error[0::2] = tar_x - cur_x
-        error[1::2] = tar_y - cur_y
-
-        mean_L = (cur_L + tar_L) / 2.0
-        vel = np.linalg.lstsq(mean_L, error)[0]
+        Both rows of a keypoint share the weight of its residual norm, so a bad
+        match is downweighted as a whole.
+        """
+        num_kp = L.shape[0] // 2
+        # the unweighted first solve, kept if the iterations stop early
+        self.weights = np.ones(num_kp)
+        for _ in range(self.irls_iters):
+            residual = np.linalg.norm((error - L @ vel).reshape(num_kp, 2), axis=1)
+            scale = self.robust_scale
+            if scale is None:
+                # median of the Rayleigh distributed norm of 2D gaussian residuals
+                scale = np.median(residual) / np.sqrt(2.0 * np.log(2.0))
+            if scale <= 1e-12:
+                break
+            u = residual / scale
+            if self.robust == "huber":
+                weights = np.minimum(1.0, 1.345 / np.maximum(u, 1e-12))
+            else:
+                weights = np.square(np.clip(1.0 - np.square(u / 4.685), 0.0, None))
+            if np.count_nonzero(weights) < 3:
+                break
+            self.weights = weights
+            vel = self._solve(L, error, np.repeat(weights, 2))
         return vel
 
+    def _solve(self, L, error, weights=None):
+        """Solve L v = e in the least squares sense, with optional LM damping.
+
+        The damped solution minimizes |L v - e|^2 + damping * v^T diag(L^T L) v.
+        Weighted solves of the IRLS iterations always use the normal equations.
+        """
+        if weights is not None:
+            Lw = np.multiply(L, weights[:, None], out=self._Lw_buf[: L.shape[0]])
+            np.dot(Lw.T, L, out=self._H)
+            np.dot(Lw.T, error, out=self._g)
+            self._H[np.diag_indices(6)] *= 1.0 + self.damping
+            return np.linalg.solve(self._H, self._g)
+        if self.solver == "lstsq" and self.damping == 0:
+            return np.linalg.lstsq(L, error, rcond=None)[0]
+        if self.solver == "qr":
+            if self.damping > 0:
+                # append the damping rows below L in the spare buffer rows
+                rows = L.shape[0]
+                column_norms = np.einsum("ij,ij->j", L, L)
+                L = self._L_buf[: rows + 6]
+                error = self._e_buf[: rows + 6]
+                L[rows:] = np.diag(np.sqrt(self.damping * column_norms))
+                error[rows:] = 0.0
+            Q, R = np.linalg.qr(L)
+            return np.linalg.solve(R, Q.T @ error)
+        np.dot(L.T, L, out=self._H)
+        np.dot(L.T, error, out=self._g)
+        self._H[np.diag_indices(6)] *= 1.0 + self.damping
+        return np.linalg.solve(self._H, self._g)
+
+    def _score_image(self, img):
+        if self.score_roi is not None:
+            x, y, w, h = self.score_roi
+            img = img[y : y + h, x : x + w]
+        return downscale(img, self.score_scale)
+
+    def calc_score(self, tar_kp=None, cur_kp=None):
+        """Convergence score of the current step, see the ``score`` argument."""
+        self._score_step += 1
+        if self.score == "none":
+            return None
+        if self._last_score is not None and (self._score_step - 1) % self.score_every:
+            return self._last_score
+        if self.score == "kp_error":
+            score = float(np.linalg.norm(tar_kp - cur_kp, axis=1).mean())
+        elif self.score == "ssim_cached":
+            if self._target_stats is None:
+                self._target_stats = metric.ssim_stats(self._score_image(self.tar_img))
+            score = metric.calc_ssim_cached(
+                self._target_stats, self._score_image(self.cur_img)
+            )
+        else:
+            score = metric.calc_ssim(
+                self._score_image(self.tar_img), self._score_image(self.cur_img)
+            )
+        self._last_score = score
+        return score
+
     def calc_vel(self, mask=None, use_median_depth=False):
         assert (
             self.kp_algo is not None and self.camera is not None
@@ -91,31 +255,44 @@ class IBVS(VisualServoControllerBase):
         tar_kp, cur_kp, match_img = self.kp_algo.match(
             self.tar_img, self.cur_img, mask, True, self.camera
         )
-        tar_kp_int = np.floor(tar_kp).astype(int)
-        cur_kp_int = np.floor(cur_kp).astype(int)
-        tar_kp_x = tar_kp_int[:, 0]
-        tar_kp_y = tar_kp_int[:, 1]
-        cur_kp_x = cur_kp_int[:, 0]
-        cur_kp_y = cur_kp_int[:, 1]
-
-        tar_depth = self.tar_depth.squeeze()
-        cur_depth = self.cur_depth.squeeze()
-
-        tar_z = tar_depth[tar_kp_y, tar_kp_x]
-        cur_z = cur_depth[cur_kp_y, cur_kp_x]
+        if tar_kp is None:
+            return None, None, match_img
+        tar_z, tar_valid = sample_depth(
+            self.tar_depth, tar_kp, self.depth_method, self.depth_window
+        )
+        cur_z, cur_valid = sample_depth(
+            self.cur_depth, cur_kp, self.depth_method, self.depth_window
+        )
+        # keypoints without valid depth in either image are dropped
+        valid = tar_valid & cur_valid
+        if valid.sum() < 3:
+            print("Too few keypoints with valid depth :{}".format(valid.sum()))
+            return None, None, match_img
+        tar_kp, cur_kp = tar_kp[valid], cur_kp[valid]
+        tar_z = self.camera.to_metric(tar_z[valid], self.tar_depth.dtype)
+        cur_z = self.camera.to_metric(cur_z[valid], self.cur_depth.dtype)
         if use_median_depth:
             tar_z = np.median(tar_z)
             cur_z = np.median(cur_z)
 
         vel = self.cal_vel_from_kp(tar_kp, cur_kp, tar_z, cur_z)
-        score = metric.calc_ssim(self.tar_img, self.cur_img)
-        cv2.putText(
-            match_img,
-            "SSIM score: {:.3f}".format(score),
-            (10, 60),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            0.8,
-            (100, 100, 100),
-            2,
+        score = self.calc_score(tar_kp, cur_kp)
+        if score is None:
+            return vel, score, match_img
+        label = "{}: {:.3f}".format(
+            "Keypoint error" if self.score == "kp_error" else "SSIM score", score
         )
+        renderer = getattr(self.kp_algo, "renderer", None)
+        if renderer is not None:
+            renderer.annotate(label)
+        elif match_img is not None:
+            cv2.putText(
+                match_img,
+                label,
+                (10, 60),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.8,
+                (100, 100, 100),
+                2,
+            )
         return vel, score, match_img
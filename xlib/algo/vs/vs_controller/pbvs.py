@@ -0,0 +1,93 @@
+import numpy as np
+from ....device.sensor.camera import Camera
+from ...cv.detector import get_aruco_pose
+from ...utils.transforms import se3Log
+from .vs_controller_base import VisualServoControllerBase
+
+
+class PBVS(VisualServoControllerBase):
+    """Position based visual servo on the pose of an ArUco board.
+
+    The camera displacement to the target view is
+    ``T = cur_pose @ inv(tar_pose)``, with both board poses in the camera frame.
+    The commanded camera twist is ``gain * log(T)``, which moves the camera
+    along the screw motion to the target.
+    """
+
+    def __init__(
+        self, camera: Camera, aruco_config: dict, gain=1.0, draw=False
+    ) -> None:
+        """
+        Args:
+            aruco_config (dict): board configuration of ``get_aruco_pose``.
+            draw (bool): return the detection image from ``calc_vel``.
+        """
+        self.camera = camera
+        self.aruco_config = aruco_config
+        self.gain = gain
+        self.draw = draw
+        self.cur_img = None
+        self.tar_img = None
+        self.cur_pose = None
+        self.tar_pose = None
+        self.error = None
+
+    def update(self, *args, **kwargs):
+        """Set images, whose board pose is detected in ``calc_vel``, or board poses directly.
+
+        Depth is not needed and ignored.
+        """
+        if "cur_img" in kwargs:
+            assert isinstance(
+                kwargs["cur_img"], np.ndarray
+            ), "Image should be a numpy array"
+            self.cur_img = kwargs["cur_img"]
+            self.cur_pose = None
+        if "tar_img" in kwargs:
+            assert isinstance(
+                kwargs["tar_img"], np.ndarray
+            ), "Image should be a numpy array"
+            self.tar_img = kwargs["tar_img"]
+            self.tar_pose = None
+        if "cur_pose" in kwargs:
+            self.cur_pose = kwargs["cur_pose"]
+        if "tar_pose" in kwargs:
+            self.tar_pose = kwargs["tar_pose"]
+
+    def _detect(self, img):
+        return get_aruco_pose(
+            self.aruco_config,
+            img,
+            self.camera.intrinsics_matrix,
+            self.camera.distortion,
+            self.draw,
+        )
+
+    def calc_vel(self):
+        """Return the camera twist, the (translation, rotation) error and the detection image.
+
+        Returns None, None, image when the board is not detected.
+        """
+        img = None
+        if self.tar_pose is None:
+            assert self.tar_img is not None, "Target image or pose not provided"
+            # the target is detected once and kept until it changes
+            _, self.tar_pose = self._detect(self.tar_img)
+            if self.tar_pose is None:
+                print("Board not detected in the target image")
+                return None, None, None
+        if self.cur_pose is None:
+            assert self.cur_img is not None, "Current image or pose not provided"
+            img, cur_pose = self._detect(self.cur_img)
+            if cur_pose is None:
+                return None, None, img
+        else:
+            cur_pose = self.cur_pose
+
+        self.error = se3Log(cur_pose @ np.linalg.inv(self.tar_pose))
+        vel = self.gain * self.error
+        score = (
+            float(np.linalg.norm(self.error[:3])),
+            float(np.linalg.norm(self.error[3:])),
+        )
+        return vel, score, img
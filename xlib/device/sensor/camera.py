@@ -2,7 +2,11 @@ import numpy as np
 import pyrealsense2 as rs
 import cv2
 import logging
+import threading
+import time
 from ...algo.cv.detector import get_aruco_pose
+from .frame_buffer import Frame, FrameBuffer
+from .recorder import RGBDRecorder
 
 
 class Camera:
@@ -16,6 +20,10 @@ class Camera:
         self.distortion = None
         self._color_img = None
         self._depth_img = None
+        self._depth_metric = None
+        self.depth_scale = None
+        self._ray_table = None
+        self._rectify_maps = None
 
     def get_frame(self):
         raise NotImplementedError("get_frame method is not implemented")
@@ -32,6 +40,8 @@ class Camera:
         cls.distortion = param_dict["distortion"]
         cls._color_img = None
         cls._depth_img = None
+        cls._ray_table = None
+        cls._rectify_maps = None
         return cls
 
     @classmethod
@@ -45,6 +55,8 @@ class Camera:
         cls.distortion = distortion
         cls._color_img = None
         cls._depth_img = None
+        cls._ray_table = None
+        cls._rectify_maps = None
 
         return cls
 
@@ -56,6 +68,8 @@ class Camera:
         self.width = width
         self.height = height
         self.distortion = distortion
+        self._ray_table = None
+        self._rectify_maps = None
 
     def set_param_from_file(self, file_path):
         param_dict = np.load(file_path, allow_pickle=True).item()
@@ -66,6 +80,8 @@ class Camera:
         self.width = param_dict["width"]
         self.height = param_dict["height"]
         self.distortion = param_dict["distortion"]
+        self._ray_table = None
+        self._rectify_maps = None
 
     @property
     def intrinsics_matrix(self):
@@ -81,46 +97,220 @@ class Camera:
 
     @property
     def depth_img(self):
-        return self._depth_img
+        """Depth image in meters, raw integer depth is converted on first access."""
+        if self._depth_metric is None and self._depth_img is not None:
+            self._depth_metric = self.to_metric(self._depth_img)
+        return self._depth_metric
 
     @depth_img.setter
     def depth_img(self, depth_img):
         self._depth_img = np.asanyarray(depth_img)
+        self._depth_metric = None
+
+    @property
+    def raw_depth_img(self):
+        """Depth image as stored, either raw integer units or meters."""
+        return self._depth_img
 
-    def backproject(self) -> np.ndarray:
+    def _metric_scale(self, dtype) -> float:
+        if not np.issubdtype(dtype, np.integer):
+            return 1.0
+        if self.depth_scale is None:
+            raise ValueError("Depth scale not set for raw depth")
+        return self.depth_scale
+
+    def to_metric(self, depth, dtype=None) -> np.ndarray:
+        """Convert depth values to meters, integer depth is scaled by ``depth_scale``.
+
+        ``dtype`` is the type of the frame the values were sampled from, for
+        samples that were interpolated to float from raw integer depth.
+        """
+        depth = np.asanyarray(depth)
+        dtype = depth.dtype if dtype is None else np.dtype(dtype)
+        if not np.issubdtype(dtype, np.integer):
+            return depth
+        return depth.astype(np.float32) * np.float32(self._metric_scale(dtype))
+
+    def depth_at(self, pixels: np.ndarray) -> np.ndarray:
+        """Sample depth in meters at (N, 2) pixel coordinates (u, v), rounded to the nearest pixel."""
+        if self._depth_img is None:
+            raise ValueError("No depth frame provided")
+        h, w = self._depth_img.shape[:2]
+        pixels = np.rint(np.asarray(pixels)).astype(int)
+        u = np.clip(pixels[:, 0], 0, w - 1)
+        v = np.clip(pixels[:, 1], 0, h - 1)
+        return self.to_metric(self._depth_img.reshape(h, w)[v, u])
+
+    @property
+    def has_distortion(self) -> bool:
+        return self.distortion is not None and bool(np.any(self.distortion))
+
+    def get_ray_table(self, height=None, width=None) -> np.ndarray:
+        """Per-pixel normalized rays ((u - cx) / fx, (v - cy) / fy), shape (h, w, 2).
+
+        With distortion the rays are undistorted once for every pixel. The table is
+        cached and rebuilt only when the intrinsics or the image size change.
+        """
+        if self.fx is None or self.fy is None or self.cx is None or self.cy is None:
+            raise ValueError("Do not set camera parameters")
+        height = self.height if height is None else height
+        width = self.width if width is None else width
+        if self._ray_table is None or self._ray_table.shape[:2] != (height, width):
+            if self.has_distortion:
+                u, v = np.meshgrid(
+                    np.arange(width, dtype=np.float32),
+                    np.arange(height, dtype=np.float32),
+                )
+                pixels = np.stack([u, v], axis=-1).reshape(-1, 1, 2)
+                ray_table = self._undistort_points(pixels).reshape(height, width, 2)
+            else:
+                ray_table = np.empty((height, width, 2), np.float32)
+                ray_table[..., 0] = (
+                    np.arange(width, dtype=np.float32) - self.cx
+                ) / self.fx
+                ray_table[..., 1] = (
+                    (np.arange(height, dtype=np.float32) - self.cy) / self.fy
+                )[:, None]
+            self._ray_table = ray_table.astype(np.float32)
+        return self._ray_table
+
+    def _undistort_points(self, pixels: np.ndarray) -> np.ndarray:
+        criteria = (cv2.TERM_CRITERIA_COUNT | cv2.TERM_CRITERIA_EPS, 20, 1e-9)
+        args = (
+            pixels.astype(np.float32),
+            self.intrinsics_matrix,
+            np.asarray(self.distortion, np.float64),
+        )
+        if hasattr(cv2, "undistortPointsIter"):
+            undistorted = cv2.undistortPointsIter(*args, None, None, criteria)
+        else:
+            undistorted = cv2.undistortPoints(*args, criteria=criteria)
+        return undistorted.reshape(-1, 2)
+
+    def _distort(self, x: np.ndarray, y: np.ndarray):
+        """Apply the OpenCV distortion model to normalized coordinates."""
+        k = np.zeros(8)
+        distortion = np.ravel(self.distortion)
+        k[: min(distortion.size, 8)] = distortion[:8]
+        k1, k2, p1, p2, k3, k4, k5, k6 = k
+        r2 = x * x + y * y
+        radial = (1 + r2 * (k1 + r2 * (k2 + r2 * k3))) / (
+            1 + r2 * (k4 + r2 * (k5 + r2 * k6))
+        )
+        xy = x * y
+        x_d = x * radial + 2 * p1 * xy + p2 * (r2 + 2 * x * x)
+        y_d = y * radial + p1 * (r2 + 2 * y * y) + 2 * p2 * xy
+        return x_d, y_d
+
+    @property
+    def ray_table(self) -> np.ndarray:
+        return self.get_ray_table()
+
+    def backproject(self, pixels=None, mask=None) -> np.ndarray:
+        """Lift the depth image to camera frame points.
+
+        Args:
+            pixels (np.ndarray, optional): (N, 2) pixel coordinates (u, v) to lift,
+                rounded to the nearest pixel like ``depth_at`` and ``sample_depth``.
+            mask (np.ndarray, optional): (h, w) boolean mask of pixels to lift.
+
+        Returns:
+            np.ndarray: (h, w, 3) points for the full frame, or (N, 3) points when
+            ``pixels`` or ``mask`` is given.
+        """
         if self._depth_img is not None:
             depth_img = self._depth_img
         else:
             raise ValueError("No depth frame provided")
-        try:
+        h, w = depth_img.shape[:2]
+        ray_table = self.get_ray_table(h, w)
 
-            h, w = depth_img.shape
-            u, v = np.meshgrid(np.arange(w), np.arange(h))
-            x = ((u - self.cx) * depth_img / self.fx).astype(np.float32)
-            y = ((v - self.cy) * depth_img / self.fy).astype(np.float32)
-            z = depth_img.astype(np.float32)
-        except:
-            raise ValueError("Do not set camera parameters ")
+        if pixels is None and mask is None:
+            points = np.empty((h, w, 3), np.float32)
+            points[..., 2] = depth_img.reshape(h, w)
+            if np.issubdtype(depth_img.dtype, np.integer):
+                points[..., 2] *= self._metric_scale(depth_img.dtype)
+            np.multiply(ray_table, points[..., 2:], out=points[..., :2])
+            return points
 
-        return np.stack([x, y, z], axis=-1)
+        if mask is not None:
+            v, u = np.nonzero(mask)
+        else:
+            pixels = np.rint(np.asarray(pixels)).astype(int)
+            u = np.clip(pixels[:, 0], 0, w - 1)
+            v = np.clip(pixels[:, 1], 0, h - 1)
+        points = np.empty((u.shape[0], 3), np.float32)
+        points[:, 2] = self.to_metric(depth_img.reshape(h, w)[v, u])
+        np.multiply(ray_table[v, u], points[:, 2:], out=points[:, :2])
+        return points
 
-    def projet(self, points: np.ndarray) -> np.ndarray:
+    def projet(self, points: np.ndarray, distort=True, integer=True) -> np.ndarray:
+        """Project (N, 3) camera frame points to pixels, truncated to int unless ``integer`` is False."""
         try:
             x, y, z = points[:, 0], points[:, 1], points[:, 2]
-            u = (x * self.fx / z + self.cx).astype(np.int)
-            v = (y * self.fy / z + self.cy).astype(np.int)
+            x, y = x / z, y / z
+            if distort and self.has_distortion:
+                if np.size(self.distortion) > 8:
+                    uv, _ = cv2.projectPoints(
+                        np.asarray(points, np.float64),
+                        np.zeros(3),
+                        np.zeros(3),
+                        self.intrinsics_matrix,
+                        np.asarray(self.distortion, np.float64),
+                    )
+                    uv = uv.reshape(-1, 2)
+                    return uv.astype(int) if integer else uv
+                x, y = self._distort(x, y)
+            u = x * self.fx + self.cx
+            v = y * self.fy + self.cy
         except:
             raise ValueError("Do not set camera parameters")
-        return np.stack([u, v], axis=-1)
+        uv = np.stack([u, v], axis=-1)
+        return uv.astype(int) if integer else uv
 
-    def pixel_to_camera_frame(self, pixel: np.ndarray):
+    def pixel_to_camera_frame(self, pixel: np.ndarray, undistort=True):
+        """Normalized camera coordinates of (N, 2) pixels.
+
+        With distortion the cached undistorted ray table is interpolated
+        bilinearly, pixels outside the image are undistorted directly.
+        """
         try:
             u, v = pixel[:, 0], pixel[:, 1]
-            x = (u - self.cx) / self.fx
-            y = (v - self.cy) / self.fy
+            if not (undistort and self.has_distortion):
+                x = (u - self.cx) / self.fx
+                y = (v - self.cy) / self.fy
+                return np.stack([x, y], axis=-1)
+            ray_table = self.ray_table
         except:
             raise ValueError("Do not set camera parameters")
-        return np.stack([x, y], axis=-1)
+        h, w = ray_table.shape[:2]
+        inside = (u >= 0) & (u <= w - 1) & (v >= 0) & (v <= h - 1)
+        u0 = np.clip(np.floor(u).astype(int), 0, w - 2)
+        v0 = np.clip(np.floor(v).astype(int), 0, h - 2)
+        du = np.clip(u - u0, 0.0, 1.0)[:, None]
+        dv = np.clip(v - v0, 0.0, 1.0)[:, None]
+        top = ray_table[v0, u0] * (1 - du) + ray_table[v0, u0 + 1] * du
+        bottom = ray_table[v0 + 1, u0] * (1 - du) + ray_table[v0 + 1, u0 + 1] * du
+        xy = top * (1 - dv) + bottom * dv
+        if not np.all(inside):
+            xy[~inside] = self._undistort_points(pixel[~inside].reshape(-1, 1, 2))
+        return xy
+
+    def rectify(self, img: np.ndarray, interpolation=cv2.INTER_LINEAR) -> np.ndarray:
+        """Undistort a full image with remap tables cached per intrinsics."""
+        if not self.has_distortion:
+            return img
+        h, w = img.shape[:2]
+        if self._rectify_maps is None or self._rectify_maps[0].shape[:2] != (h, w):
+            self._rectify_maps = cv2.initUndistortRectifyMap(
+                self.intrinsics_matrix,
+                np.asarray(self.distortion, np.float64),
+                None,
+                self.intrinsics_matrix,
+                (w, h),
+                cv2.CV_16SC2,
+            )
+        return cv2.remap(img, *self._rectify_maps, interpolation)
 
     def get_aruco_pose(self, config):
         return get_aruco_pose(
@@ -128,6 +318,39 @@ class Camera:
         )
 
 
+# librealsense processing blocks and the options they accept
+DEPTH_FILTERS = {
+    "decimation": (
+        rs.decimation_filter,
+        {"magnitude": rs.option.filter_magnitude},
+    ),
+    "threshold": (
+        rs.threshold_filter,
+        {"min_distance": rs.option.min_distance, "max_distance": rs.option.max_distance},
+    ),
+    "disparity": (lambda: rs.disparity_transform(True), {}),
+    "depth": (lambda: rs.disparity_transform(False), {}),
+    "spatial": (
+        rs.spatial_filter,
+        {
+            "magnitude": rs.option.filter_magnitude,
+            "smooth_alpha": rs.option.filter_smooth_alpha,
+            "smooth_delta": rs.option.filter_smooth_delta,
+            "holes_fill": rs.option.holes_fill,
+        },
+    ),
+    "temporal": (
+        rs.temporal_filter,
+        {
+            "smooth_alpha": rs.option.filter_smooth_alpha,
+            "smooth_delta": rs.option.filter_smooth_delta,
+            "persistence_control": rs.option.holes_fill,
+        },
+    ),
+    "hole_filling": (rs.hole_filling_filter, {"mode": rs.option.holes_fill}),
+}
+
+
 class RealSenseCamera(Camera):
     def __init__(
         self,
@@ -140,9 +363,23 @@ class RealSenseCamera(Camera):
         exposure_time=None,
         align_to=rs.stream.color,
         serail_number=None,
+        streaming=False,
+        buffer_size=4,
+        depth_mode="metric",
+        inter_cam_sync_mode=None,
+        depth_filters=None,
     ):
+        """
+        Args:
+            depth_filters (list, optional): depth post-processing chain applied before
+                alignment, e.g. ``["decimation", ("threshold", {"max_distance": 1.5}),
+                "disparity", "spatial", "temporal", "depth", "hole_filling"]``.
+                See ``DEPTH_FILTERS`` for the filter names and their options.
+        """
         super().__init__()
 
+        assert depth_mode in ["metric", "raw"], "Depth mode should be metric or raw"
+        self.depth_mode = depth_mode
         self.frame_rate = frame_rate
         self.pipeline = rs.pipeline()
 
@@ -171,6 +408,9 @@ class RealSenseCamera(Camera):
             depth_sensor.set_option(rs.option.visual_preset, 5)
         else:
             depth_sensor.set_option(rs.option.visual_preset, 3)
+        if inter_cam_sync_mode is not None:
+            # 0: default, 1: master, 2: slave
+            depth_sensor.set_option(rs.option.inter_cam_sync_mode, inter_cam_sync_mode)
         self.depth_scale = depth_sensor.get_depth_scale()
         profile = cfg.get_stream(rs.stream.color)
         intrinsics = profile.as_video_stream_profile().get_intrinsics()
@@ -199,20 +439,138 @@ class RealSenseCamera(Camera):
             "-------------------------------------------------------------------------------------"
         )
         self.align_to_color = rs.align(align_to)
+        self.depth_filters = self._build_depth_filters(depth_filters or [])
 
-    def get_frame(self):
+        self._buffer = None
+        self._capture_thread = None
+        self._stop_event = threading.Event()
+        if streaming:
+            self.start_streaming(buffer_size)
+
+    @staticmethod
+    def _build_depth_filters(depth_filters):
+        filters = []
+        for depth_filter in depth_filters:
+            if isinstance(depth_filter, str):
+                name, options = depth_filter, {}
+            else:
+                name, options = depth_filter
+            if name not in DEPTH_FILTERS:
+                raise ValueError(f"Invalid depth filter: {name}")
+            create, valid_options = DEPTH_FILTERS[name]
+            block = create()
+            for key, value in options.items():
+                if key not in valid_options:
+                    raise ValueError(f"Invalid option {key} for depth filter {name}")
+                block.set_option(valid_options[key], value)
+            filters.append(block)
+            logging.info(f"Depth filter: {name} {options}")
+        return filters
+
+    def _capture(self, keep=False) -> Frame:
         frames = self.pipeline.wait_for_frames()
+        if self.depth_filters:
+            # the filters only touch the depth frame of the frameset
+            for depth_filter in self.depth_filters:
+                frames = depth_filter.process(frames)
+            frames = frames.as_frameset()
         frames = self.align_to_color.process(frames)
+        if keep or self.streaming:
+            # buffered frames outlive this call, take them out of the librealsense frame pool
+            frames.keep()
         color_frame = frames.get_color_frame()
         depth_frame = frames.get_depth_frame()
-        color_img = color_frame.get_data()
-        depth_img = depth_frame.get_data()
-        depth_img = np.asanyarray(depth_img).astype(np.float32) * self.depth_scale
-        self.color_img = color_img
-        self.depth_img = depth_img
-        return self.color_img, self.depth_img
+        color_img = np.asanyarray(color_frame.get_data())
+        depth_img = np.asanyarray(depth_frame.get_data())
+        if self.depth_mode == "metric":
+            depth_img = depth_img.astype(np.float32)
+            depth_img *= self.depth_scale
+        return Frame(
+            color_img,
+            depth_img,
+            frames.get_timestamp() / 1000.0,
+            frames.get_frame_number(),
+            time.time(),
+        )
+
+    def _capture_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                frame = self._capture()
+            except RuntimeError as e:
+                logging.warning(f"Capture failed: {e}")
+                continue
+            self._buffer.push(frame)
+
+    def _set_frame(self, frame: Frame):
+        if frame is not None:
+            self.color_img = frame.color
+            self.depth_img = frame.depth
+        return frame
+
+    @property
+    def streaming(self) -> bool:
+        return self._capture_thread is not None
+
+    def start_streaming(self, buffer_size=4):
+        """Capture frames in a background thread into a bounded ring buffer.
+
+        Once streaming, ``get_frame`` returns the newest buffered frame instead of
+        waiting on the sensor; use ``latest`` and ``next`` for timestamps and frame numbers.
+        """
+        if self.streaming:
+            return
+        self._buffer = FrameBuffer(buffer_size)
+        self._stop_event.clear()
+        self._capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self._capture_thread.start()
+        logging.info(f"Camera streaming started, buffer size: {buffer_size}")
+
+    def stop_streaming(self):
+        if not self.streaming:
+            return
+        self._stop_event.set()
+        self._capture_thread.join()
+        self._capture_thread = None
+        logging.info(
+            f"Camera streaming stopped, captured: {self._buffer.pushed}, "
+            f"dropped: {self._buffer.dropped}, sensor dropped: {self._buffer.sensor_dropped}"
+        )
+
+    def latest(self):
+        """Return the newest buffered frame without blocking, None if none captured yet."""
+        assert self.streaming, "Camera is not streaming"
+        return self._set_frame(self._buffer.latest())
+
+    def next(self, timeout=None):
+        """Return the next unread buffered frame, blocking until it arrives or ``timeout``."""
+        assert self.streaming, "Camera is not streaming"
+        return self._set_frame(self._buffer.next(timeout))
+
+    @property
+    def frame_buffer(self) -> FrameBuffer:
+        return self._buffer
+
+    @property
+    def dropped_frames(self) -> int:
+        """Frames overwritten in the ring buffer before being read."""
+        return self._buffer.dropped if self._buffer is not None else 0
+
+    @property
+    def sensor_dropped_frames(self) -> int:
+        """Frames missing from the device frame number sequence."""
+        return self._buffer.sensor_dropped if self._buffer is not None else 0
+
+    def get_frame(self):
+        if self.streaming:
+            if self.latest() is None:
+                self.next()
+        else:
+            self._set_frame(self._capture())
+        return self.color_img, self.raw_depth_img
 
     def stop(self):
+        self.stop_streaming()
         self.pipeline.stop()
 
     def show(self):
@@ -238,3 +596,34 @@ class RealSenseCamera(Camera):
         out.release()
         logging.info("End recording Video")
         cv2.destroyAllWindows()
+
+    def recordRGBD(self, save_path, robot=None, chunk_size=300, queue_size=64):
+        """Record color, depth and optionally the robot tcp pose, press Q to stop.
+
+        Frames are written by ``RGBDRecorder`` on its own thread, read them back
+        with ``RGBDReader``.
+        """
+        logging.info("Begin recording RGB-D, Press Q to stop")
+        recorder = RGBDRecorder(
+            save_path,
+            camera=self,
+            chunk_size=chunk_size,
+            queue_size=queue_size,
+            record_pose=robot is not None,
+        )
+        with recorder:
+            while True:
+                # queued frames wait for the writer thread, keep() them like buffered ones
+                frame = (
+                    self.next()
+                    if self.streaming
+                    else self._set_frame(self._capture(keep=True))
+                )
+                pose = robot.tcp_pose if robot is not None else None
+                recorder.write(
+                    frame.color, frame.depth, frame.timestamp, frame.frame_number, pose
+                )
+                cv2.imshow("Color Image", frame.color)
+                if cv2.waitKey(1) & 0xFF == ord("q"):
+                    break
+        cv2.destroyAllWindows()
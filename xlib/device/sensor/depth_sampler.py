@@ -0,0 +1,82 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+DEPTH_SAMPLE_METHODS = ["nearest", "bilinear", "median", "min"]
+
+
+def sample_depth(depth: np.ndarray, pixels: np.ndarray, method="nearest", window=3):
+    """Sample depth at a batch of (N, 2) pixel coordinates (u, v).
+
+    Zero, negative and NaN depth is invalid and never contributes to a sample.
+    Only the sampled neighbourhoods are gathered, the depth frame is not copied.
+
+    Args:
+        depth (np.ndarray): (H, W) or (H, W, 1) depth in raw units or meters.
+        method (str): "nearest" pixel, rounded like ``Camera.depth_at``,
+            "bilinear" interpolation over the valid neighbours, or "median" /
+            "min" of the valid depths in a ``window`` x ``window`` neighbourhood
+            centered on the nearest pixel. Windows at the border are shifted
+            inside the image.
+
+    Returns:
+        tuple: (N,) depth in the units of ``depth`` with 0 where invalid, and the
+            (N,) boolean validity.
+    """
+    assert method in DEPTH_SAMPLE_METHODS, "Invalid depth sample method"
+    h, w = depth.shape[:2]
+    depth = depth.reshape(h, w)
+    pixels = np.asarray(pixels, np.float64).reshape(-1, 2)
+    u, v = pixels[:, 0], pixels[:, 1]
+
+    if method == "nearest":
+        values = depth[
+            np.clip(np.rint(v).astype(int), 0, h - 1),
+            np.clip(np.rint(u).astype(int), 0, w - 1),
+        ]
+        valid = values > 0
+        return np.where(valid, values, 0), valid
+
+    if method == "bilinear":
+        u0 = np.clip(np.floor(u).astype(int), 0, w - 2)
+        v0 = np.clip(np.floor(v).astype(int), 0, h - 2)
+        du = np.clip(u - u0, 0.0, 1.0)
+        dv = np.clip(v - v0, 0.0, 1.0)
+        corners = np.stack(
+            [
+                depth[v0, u0],
+                depth[v0, u0 + 1],
+                depth[v0 + 1, u0],
+                depth[v0 + 1, u0 + 1],
+            ],
+            axis=1,
+        ).astype(np.float64)
+        weights = np.stack(
+            [(1 - du) * (1 - dv), du * (1 - dv), (1 - du) * dv, du * dv], axis=1
+        )
+        # renormalize over the valid corners
+        corner_valid = corners > 0
+        weights = np.where(corner_valid, weights, 0.0)
+        total = weights.sum(axis=1)
+        valid = total > 1e-12
+        values = np.where(corner_valid, corners, 0.0)
+        values = (values * weights).sum(axis=1) / np.where(valid, total, 1.0)
+        return np.where(valid, values, 0.0), valid
+
+    assert window % 2 == 1 and window <= min(h, w), "Window should be odd and fit the image"
+    radius = window // 2
+    windows = sliding_window_view(depth, (window, window))
+    uc = np.clip(np.rint(u).astype(int), radius, w - 1 - radius) - radius
+    vc = np.clip(np.rint(v).astype(int), radius, h - 1 - radius) - radius
+    patches = windows[vc, uc].reshape(-1, window * window).astype(np.float64)
+    patch_valid = patches > 0
+    valid = patch_valid.any(axis=1)
+    if method == "min":
+        values = np.where(patch_valid, patches, np.inf).min(axis=1)
+    else:
+        # invalid depths sort last, the median is taken over the valid prefix
+        count = patch_valid.sum(axis=1)
+        ordered = np.sort(np.where(patch_valid, patches, np.inf), axis=1)
+        lower = np.take_along_axis(ordered, np.maximum(count - 1, 0)[:, None] // 2, 1)
+        upper = np.take_along_axis(ordered, (count // 2)[:, None], 1)
+        values = 0.5 * (lower + upper).ravel()
+    return np.where(valid, values, 0.0), valid
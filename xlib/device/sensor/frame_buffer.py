@@ -0,0 +1,91 @@
+import threading
+from collections import deque, namedtuple
+
+Frame = namedtuple(
+    "Frame",
+    ["color", "depth", "timestamp", "frame_number", "host_timestamp"],
+    defaults=[None],
+)
+
+
+class FrameBuffer:
+    """Bounded ring buffer of frames shared between a capture thread and a consumer.
+
+    The producer never blocks: when the buffer is full the oldest entry is
+    overwritten. Entries that are evicted before the consumer has seen them
+    are counted in ``dropped``; gaps in the device frame numbers are counted
+    in ``sensor_dropped``.
+    """
+
+    def __init__(self, size: int = 4) -> None:
+        assert size > 0, "Buffer size should be positive"
+        self.size = size
+        self._frames = deque(maxlen=size)
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._read_seq = 0
+        self._last_frame_number = None
+        self.pushed = 0
+        self.dropped = 0
+        self.sensor_dropped = 0
+
+    def push(self, frame: Frame) -> None:
+        with self._cond:
+            if len(self._frames) == self._frames.maxlen:
+                evicted_seq, _ = self._frames[0]
+                if evicted_seq > self._read_seq:
+                    self.dropped += 1
+            if self._last_frame_number is not None:
+                gap = frame.frame_number - self._last_frame_number - 1
+                if gap > 0:
+                    self.sensor_dropped += gap
+            self._last_frame_number = frame.frame_number
+            self._seq += 1
+            self.pushed += 1
+            self._frames.append((self._seq, frame))
+            self._cond.notify_all()
+
+    def latest(self):
+        """Return the newest frame without waiting, or None if nothing was captured yet."""
+        with self._cond:
+            if not self._frames:
+                return None
+            seq, frame = self._frames[-1]
+            self._read_seq = max(self._read_seq, seq)
+            return frame
+
+    def next(self, timeout=None):
+        """Return the oldest frame not yet read, waiting for one if necessary.
+
+        Returns None if no new frame arrives within ``timeout`` seconds.
+        """
+        with self._cond:
+            if not self._cond.wait_for(
+                lambda: self._frames and self._frames[-1][0] > self._read_seq,
+                timeout,
+            ):
+                return None
+            for seq, frame in self._frames:
+                if seq > self._read_seq:
+                    self._read_seq = seq
+                    return frame
+
+    def wait_pushed(self, count: int, timeout=None) -> bool:
+        """Wait until more than ``count`` frames have been pushed in total."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.pushed > count, timeout)
+
+    def snapshot(self):
+        """Return a copy of the buffered frames, oldest first."""
+        with self._cond:
+            return [frame for _, frame in self._frames]
+
+    def clear(self) -> None:
+        with self._cond:
+            self._frames.clear()
+            self._read_seq = self._seq
+            self._last_frame_number = None
+
+    def __len__(self):
+        with self._cond:
+            return len(self._frames)
@@ -0,0 +1,140 @@
+import time
+import logging
+from collections import deque
+import numpy as np
+from .camera import RealSenseCamera
+
+
+class MultiCameraManager:
+    """Capture several RealSense cameras in parallel and return time-aligned framesets.
+
+    Every camera streams on its own capture thread into its ring buffer.
+    ``get_frameset`` picks, for each camera, the buffered frame closest to the
+    newest instant all cameras have reached, and accepts the set when the
+    timestamp spread is within ``tolerance`` seconds.
+    """
+
+    def __init__(
+        self,
+        cameras,
+        tolerance=0.005,
+        timestamp="hardware",
+        hardware_sync=False,
+        buffer_size=8,
+        stats_size=1000,
+        **camera_kwargs,
+    ) -> None:
+        """
+        Args:
+            cameras (list): serial numbers or ``RealSenseCamera`` instances.
+            tolerance (float): maximum accepted timestamp spread in seconds.
+            timestamp (str): "hardware" for the device timestamps, "host" for the
+                host arrival time.
+            hardware_sync (bool): make the first camera the inter-camera sync
+                master and the others slaves, requires a sync cable.
+            camera_kwargs: forwarded to ``RealSenseCamera`` for serial numbers.
+        """
+        assert timestamp in ["hardware", "host"], "Invalid timestamp source"
+        self.tolerance = tolerance
+        self.timestamp = timestamp
+        self.cameras = []
+        for i, camera in enumerate(cameras):
+            if isinstance(camera, str):
+                sync_mode = None
+                if hardware_sync:
+                    sync_mode = 1 if i == 0 else 2
+                camera = RealSenseCamera(
+                    serail_number=camera,
+                    inter_cam_sync_mode=sync_mode,
+                    **camera_kwargs,
+                )
+            if not camera.streaming:
+                camera.start_streaming(buffer_size)
+            self.cameras.append(camera)
+        self._skews = deque(maxlen=stats_size)
+        self._last_stamps = [None] * len(self.cameras)
+        self.framesets = 0
+        self.rejected = 0
+        self.timeouts = 0
+        logging.info(f"Multi camera manager started with {len(self.cameras)} cameras")
+
+    def _timestamp(self, frame):
+        if self.timestamp == "host":
+            return frame.host_timestamp
+        return frame.timestamp
+
+    def get_frameset(self, timeout=1.0):
+        """Return a list of time-aligned frames, one per camera, or None on timeout."""
+        deadline = time.perf_counter() + timeout
+        # the same misaligned candidates are checked again on every wake-up,
+        # so a call counts as rejected once however often it re-checks
+        rejected = False
+        while True:
+            buffers = [camera.frame_buffer for camera in self.cameras]
+            pushed = [buffer.pushed for buffer in buffers]
+            # only frames newer than the last returned frameset are candidates
+            snapshots = [
+                [
+                    frame
+                    for frame in buffer.snapshot()
+                    if last is None or self._timestamp(frame) > last
+                ]
+                for buffer, last in zip(buffers, self._last_stamps)
+            ]
+            if all(snapshots):
+                latest = [self._timestamp(snapshot[-1]) for snapshot in snapshots]
+                lagging = int(np.argmin(latest))
+                ref = latest[lagging]
+                frameset = [
+                    min(snapshot, key=lambda f: abs(self._timestamp(f) - ref))
+                    for snapshot in snapshots
+                ]
+                stamps = [self._timestamp(frame) for frame in frameset]
+                skew = max(stamps) - min(stamps)
+                if skew <= self.tolerance:
+                    self.rejected += rejected
+                    self._last_stamps = stamps
+                    self._skews.append(skew)
+                    self.framesets += 1
+                    for camera, frame in zip(self.cameras, frameset):
+                        camera.color_img = frame.color
+                        camera.depth_img = frame.depth
+                    return frameset
+                rejected = True
+            else:
+                lagging = [len(snapshot) for snapshot in snapshots].index(0)
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 or not buffers[lagging].wait_pushed(
+                pushed[lagging], remaining
+            ):
+                self.rejected += rejected
+                self.timeouts += 1
+                return None
+
+    def skew_stats(self) -> dict:
+        """Timestamp spread statistics of the accepted framesets, in seconds.
+
+        ``rejected`` counts the ``get_frameset`` calls that had to discard at least
+        one candidate set over the tolerance.
+        """
+        skews = np.array(self._skews)
+        stats = {
+            "framesets": self.framesets,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
+        if skews.size > 0:
+            stats.update(
+                {
+                    "mean": float(skews.mean()),
+                    "median": float(np.median(skews)),
+                    "p95": float(np.percentile(skews, 95)),
+                    "max": float(skews.max()),
+                }
+            )
+        return stats
+
+    def stop(self):
+        for camera in self.cameras:
+            camera.stop()
+        logging.info(f"Multi camera manager stopped, skew stats: {self.skew_stats()}")
@@ -0,0 +1,269 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from .frame_buffer import Frame
+
+INDEX_DTYPE = np.dtype(
+    [("timestamp", "<f8"), ("host_timestamp", "<f8"), ("frame_number", "<i8")]
+)
+
+
+def _open_chunk_arrays(save_path, meta, chunk_idx, mode):
+    arrays = {
+        "color": (meta["color_shape"], meta["color_dtype"]),
+        "depth": (meta["depth_shape"], meta["depth_dtype"]),
+    }
+    if meta["has_pose"]:
+        arrays["pose"] = ([4, 4], "<f8")
+    return {
+        name: np.memmap(
+            os.path.join(save_path, f"{name}_{chunk_idx:05d}.bin"),
+            dtype=np.dtype(dtype),
+            mode=mode,
+            shape=(meta["chunk_size"], *shape),
+        )
+        for name, (shape, dtype) in arrays.items()
+    }
+
+
+class RGBDRecorder:
+    """Record color, depth and optional tcp poses to a chunked on-disk format.
+
+    A recording is a directory holding ``meta.json``, an append-only
+    ``index.bin`` with one ``INDEX_DTYPE`` record per frame, and fixed-size
+    chunks of raw arrays (``color_00000.bin``, ``depth_00000.bin``,
+    ``pose_00000.bin``) written through memory maps. Frames are handed to a
+    writer thread through a bounded queue, so ``write`` never blocks the
+    capture loop; frames that do not fit in the queue are counted in ``dropped``.
+    Queued arrays are stored by reference and must not be modified afterwards.
+    An error on the writer thread, e.g. a frame of a different shape or a full
+    disk, ends the recording: ``write`` raises it from then on and ``stop``
+    raises it after closing the files.
+    """
+
+    def __init__(
+        self,
+        save_path: str,
+        camera=None,
+        chunk_size: int = 300,
+        queue_size: int = 64,
+        record_pose: bool = False,
+    ) -> None:
+        self.save_path = save_path
+        self.camera = camera
+        self.chunk_size = chunk_size
+        self.record_pose = record_pose
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._error = None
+        self._meta = None
+        self._chunk = {}
+        self._index_file = None
+        self._submitted = 0
+        self.written = 0
+        self.dropped = 0
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        if not os.path.exists(self.save_path):
+            os.makedirs(self.save_path)
+        self._index_file = open(os.path.join(self.save_path, "index.bin"), "wb")
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+        logging.info(f"Begin recording RGB-D to {self.save_path}")
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+        # a dead writer no longer drains the queue, never block on it
+        while self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self._thread.join()
+        self._thread = None
+        self._close_chunk()
+        self._index_file.close()
+        if self._meta is not None:
+            self._meta["num_frames"] = self.written
+            self._write_meta()
+        logging.info(
+            f"End recording RGB-D, written: {self.written}, dropped: {self.dropped}"
+        )
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def write(
+        self,
+        color: np.ndarray,
+        depth: np.ndarray,
+        timestamp: float = None,
+        frame_number: int = None,
+        pose: np.ndarray = None,
+    ) -> bool:
+        """Queue a frame for writing, returns False if the frame was dropped."""
+        assert self._thread is not None, "Recorder is not started"
+        if self._error is not None:
+            raise RuntimeError("RGB-D writer stopped") from self._error
+        host_timestamp = time.time()
+        if timestamp is None:
+            timestamp = host_timestamp
+        if frame_number is None:
+            frame_number = self._submitted
+        self._submitted += 1
+        try:
+            self._queue.put_nowait(
+                (color, depth, pose, timestamp, host_timestamp, frame_number)
+            )
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def _init_meta(self, color, depth):
+        self._meta = {
+            "chunk_size": self.chunk_size,
+            "color_shape": list(color.shape),
+            "color_dtype": color.dtype.str,
+            "depth_shape": list(depth.shape),
+            "depth_dtype": depth.dtype.str,
+            "has_pose": self.record_pose,
+            "num_frames": 0,
+        }
+        if self.camera is not None:
+            distortion = self.camera.distortion
+            self._meta.update(
+                {
+                    "fx": self.camera.fx,
+                    "fy": self.camera.fy,
+                    "cx": self.camera.cx,
+                    "cy": self.camera.cy,
+                    "width": self.camera.width,
+                    "height": self.camera.height,
+                    "distortion": (
+                        None if distortion is None else np.asarray(distortion).tolist()
+                    ),
+                    "depth_scale": self.camera.depth_scale,
+                    "frame_rate": getattr(self.camera, "frame_rate", None),
+                }
+            )
+        self._write_meta()
+
+    def _write_meta(self):
+        with open(os.path.join(self.save_path, "meta.json"), "w") as f:
+            json.dump(self._meta, f, indent=4)
+
+    def _close_chunk(self):
+        for array in self._chunk.values():
+            array.flush()
+        self._chunk = {}
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                self._write_item(item)
+            except Exception as e:
+                logging.exception(e)
+                self._error = e
+                break
+
+    def _write_item(self, item):
+        color, depth, pose, timestamp, host_timestamp, frame_number = item
+        if self._meta is None:
+            self._init_meta(color, depth)
+        chunk_idx, slot = divmod(self.written, self.chunk_size)
+        if slot == 0:
+            self._close_chunk()
+            self._chunk = _open_chunk_arrays(
+                self.save_path, self._meta, chunk_idx, "w+"
+            )
+        self._chunk["color"][slot] = color
+        self._chunk["depth"][slot] = depth
+        if self.record_pose:
+            self._chunk["pose"][slot] = np.nan if pose is None else pose
+        record = np.array(
+            [(timestamp, host_timestamp, frame_number)], dtype=INDEX_DTYPE
+        )
+        self._index_file.write(record.tobytes())
+        self._index_file.flush()
+        self.written += 1
+
+
+class RGBDReader:
+    """Random-access reader for recordings written by ``RGBDRecorder``."""
+
+    def __init__(self, save_path: str, max_open_chunks: int = 8) -> None:
+        self.save_path = save_path
+        with open(os.path.join(save_path, "meta.json"), "r") as f:
+            self.meta = json.load(f)
+        self.index = np.fromfile(
+            os.path.join(save_path, "index.bin"), dtype=INDEX_DTYPE
+        )
+        self.chunk_size = self.meta["chunk_size"]
+        self.has_pose = self.meta["has_pose"]
+        self._max_open_chunks = max_open_chunks
+        self._chunks = OrderedDict()
+
+    def __len__(self):
+        return self.index.shape[0]
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self.index["timestamp"]
+
+    @property
+    def intrinsics(self) -> dict:
+        keys = ["fx", "fy", "cx", "cy", "width", "height", "distortion", "depth_scale"]
+        return {k: self.meta.get(k) for k in keys}
+
+    def _get_chunk(self, chunk_idx):
+        if chunk_idx in self._chunks:
+            self._chunks.move_to_end(chunk_idx)
+            return self._chunks[chunk_idx]
+        chunk = _open_chunk_arrays(self.save_path, self.meta, chunk_idx, "r")
+        self._chunks[chunk_idx] = chunk
+        if len(self._chunks) > self._max_open_chunks:
+            self._chunks.popitem(last=False)
+        return chunk
+
+    def __getitem__(self, idx: int) -> Frame:
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError(f"Frame index {idx} out of range")
+        chunk_idx, slot = divmod(idx, self.chunk_size)
+        chunk = self._get_chunk(chunk_idx)
+        record = self.index[idx]
+        return Frame(
+            chunk["color"][slot],
+            chunk["depth"][slot],
+            float(record["timestamp"]),
+            int(record["frame_number"]),
+        )
+
+    def get_pose(self, idx: int) -> np.ndarray:
+        if not self.has_pose:
+            return None
+        if idx < 0:
+            idx += len(self)
+        chunk_idx, slot = divmod(idx, self.chunk_size)
+        return np.array(self._get_chunk(chunk_idx)["pose"][slot])
@@ -0,0 +1,156 @@
+import time
+import logging
+import numpy as np
+from .camera import Camera
+from .frame_buffer import Frame
+from .recorder import RGBDReader
+
+
+class ReplayCamera(Camera):
+    """Camera that replays a recorded color/depth sequence through ``get_frame``.
+
+    Modes:
+        realtime: frames are paced by their recorded timestamps (scaled by
+            ``playback_speed``); a slow consumer skips frames like a live sensor.
+        fast: every call returns the next frame without waiting.
+        fixed: a virtual clock advances ``step`` seconds per call and the newest
+            frame at that time is returned, deterministic and without waiting.
+    """
+
+    def __init__(
+        self,
+        source,
+        mode="fast",
+        step=None,
+        loop=False,
+        playback_speed=1.0,
+        frame_rate=30,
+        intrinsics=None,
+        depth_mode="metric",
+    ):
+        """
+        Args:
+            source: ``RGBDRecorder`` directory, ``RGBDReader``, or a sequence of
+                ``Frame`` / (color, depth) tuples.
+            step (float, optional): virtual time step of the fixed mode, defaults to 1 / frame_rate.
+            frame_rate (int): rate assumed for sequences without timestamps.
+            intrinsics (dict or str, optional): camera parameters, or a parameter file
+                for ``set_param_from_file``, overriding those of the recording.
+        """
+        super().__init__()
+        assert mode in ["realtime", "fast", "fixed"], "Invalid replay mode"
+        assert depth_mode in ["metric", "raw"], "Depth mode should be metric or raw"
+        if isinstance(source, str):
+            source = RGBDReader(source)
+        self.source = source
+        self.mode = mode
+        self.loop = loop
+        self.playback_speed = playback_speed
+        self.depth_mode = depth_mode
+
+        if isinstance(source, RGBDReader):
+            self._timestamps = source.timestamps
+            if source.meta.get("frame_rate") is not None:
+                frame_rate = source.meta["frame_rate"]
+            if intrinsics is None and source.meta.get("fx") is not None:
+                intrinsics = source.intrinsics
+        else:
+            self._timestamps = np.array(
+                [
+                    frame.timestamp if isinstance(frame, Frame) else i / frame_rate
+                    for i, frame in enumerate(source)
+                ]
+            )
+        assert len(self._timestamps) > 0, "Empty replay source"
+        self.frame_rate = frame_rate
+        self.step = 1.0 / frame_rate if step is None else step
+
+        if isinstance(intrinsics, str):
+            self.set_param_from_file(intrinsics)
+        elif intrinsics is not None:
+            self.set_param(
+                fx=intrinsics["fx"],
+                fy=intrinsics["fy"],
+                cx=intrinsics["cx"],
+                cy=intrinsics["cy"],
+                width=intrinsics["width"],
+                height=intrinsics["height"],
+                distortion=(
+                    None
+                    if intrinsics.get("distortion") is None
+                    else np.array(intrinsics["distortion"])
+                ),
+            )
+            self.depth_scale = intrinsics.get("depth_scale")
+
+        self.finished = False
+        self.frame_idx = -1
+        self.frame = None
+        self.reset()
+
+    def reset(self):
+        self._num_calls = 0
+        self._start_time = None
+        self._last_idx = -1
+        self.finished = False
+
+    def __len__(self):
+        return len(self._timestamps)
+
+    def _read(self, idx) -> Frame:
+        frame = self.source[idx]
+        if isinstance(frame, Frame):
+            return frame
+        color, depth = frame
+        return Frame(color, depth, float(self._timestamps[idx]), idx)
+
+    def _next_idx(self):
+        num_frames = len(self._timestamps)
+        if self.mode == "fast":
+            idx = self._last_idx + 1
+        elif self.mode == "fixed":
+            now = self._timestamps[0] + self._num_calls * self.step
+            idx = int(np.searchsorted(self._timestamps, now, side="right")) - 1
+            if now >= self._timestamps[-1] + 1.0 / self.frame_rate:
+                # the last frame is shown for one frame period
+                idx = num_frames
+        else:
+            if self._start_time is None:
+                self._start_time = time.perf_counter()
+            elapsed = (time.perf_counter() - self._start_time) * self.playback_speed
+            now = self._timestamps[0] + elapsed
+            idx = int(np.searchsorted(self._timestamps, now, side="right")) - 1
+            idx = max(idx, self._last_idx + 1)
+            if idx < num_frames:
+                wait = (self._timestamps[idx] - now) / self.playback_speed
+                if wait > 0:
+                    time.sleep(wait)
+        self._num_calls += 1
+        return idx
+
+    def get_frame(self):
+        idx = self._next_idx()
+        if idx >= len(self._timestamps):
+            if not self.loop:
+                if not self.finished:
+                    logging.info("Replay finished")
+                self.finished = True
+                return None, None
+            self.reset()
+            idx = self._next_idx()
+        self._last_idx = idx
+        self.frame_idx = idx
+        self.frame = self._read(idx)
+        self.color_img = self.frame.color
+        if self.depth_mode == "metric":
+            self.depth_img = self.to_metric(self.frame.depth)
+        else:
+            self.depth_img = self.frame.depth
+        return self.color_img, self.raw_depth_img
+
+    @property
+    def tcp_pose(self) -> np.ndarray:
+        """Recorded tcp pose of the current frame, None if not recorded."""
+        if self.frame_idx < 0 or not isinstance(self.source, RGBDReader):
+            return None
+        return self.source.get_pose(self.frame_idx)